@@ -1,11 +1,20 @@
 import os
 import re
+import unicodedata
+import argparse
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, Future
 import fitz  # PyMuPDF
 import pytesseract
-from pdf2image import convert_from_path
+from PIL import Image
 from nltk.tokenize import sent_tokenize
 import nltk
 from collections import Counter
+from text_normalizer import normalize_text, normalize_stream
+from extraction_cache import (open_cache, file_hash, settings_key, get_pages, put_pages,
+                              is_document_current, put_document, invalidate, evict,
+                              DEFAULT_MAX_BYTES)
 
 # 下载必要的 NLTK 数据
 try:
@@ -20,124 +29,251 @@ except LookupError:
 # 设置路径
 folder_path = "/Users/liuxduan/Desktop/Prodigy/Alphine_Journal_Latest_2020-2022/The Alphine Journal 2022"
 output_folder = os.path.join(folder_path, "smart_extracted_sentences")
-os.makedirs(output_folder, exist_ok=True)
+# 提取缓存放在各年份文件夹的上一级，多个年份共用
+cache_path = os.path.join(os.path.dirname(folder_path), ".extraction_cache.sqlite")
+
+# OCR 设置
+OCR_DPI = 300
+OCR_WORKERS = os.cpu_count() or 1  # Tesseract 进程池大小
+OCR_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,!?;:()[]"\'- '
+
+# 修改清理规则（text_normalizer）后递增，使已缓存的输出失效（页面文本缓存仍然有效）
+CLEAN_TEXT_VERSION = "1"
 
 def clean_text(text):
-    """清理提取的文本"""
-    # 移除连字符后的空格 (例如 "self- contained" -> "self-contained")
-    text = re.sub(r'-\s+', '-', text)
-    
-    # 移除名字中间的连字符和后面的空格 (例如 "Zimmer- man" -> "Zimmerman")
-    # 匹配大写字母开头的单词中的连字符模式
-    text = re.sub(r'([A-Z][a-z]+)-\s*([a-z]+)', r'\1\2', text)
-    
-    # 移除明显是单词内部错误的连字符 (例如 "west-ern" -> "western")
-    # 匹配模式：小写字母-连字符-小写字母，且前后都是字母（不是复合词）
-    text = re.sub(r'([a-z])-([a-z])', r'\1\2', text)
-    
-    # 只处理明显的单字母分割模式，更加保守
-    # 匹配：单字母 + 空格 + 单字母 + 空格 + 字母，且整体长度较短（可能是被分割的单词）
-    # 例如: "h e l l o" 但不影响 "a special time"
-    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z]+)\b', r'\1\2\3\4\5', text)
-    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\b', r'\1\2\3\4', text)
-    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\b', r'\1\2\3', text)
-    
-    # 移除多余空白
-    text = re.sub(r'\s+', ' ', text)
-    # 移除特殊字符（保留基本标点）
-    text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\"\']+', ' ', text)
-    # 移除过短的"句子"（可能是页码等）
-    lines = text.split('\n')
-    cleaned_lines = [line.strip() for line in lines if len(line.strip()) > 10]
-    return '\n'.join(cleaned_lines)
+    """清理提取的文本
+
+    规则见 text_normalizer.clean_text_reference；这里使用预编译、合并后的实现，
+    输出完全相同（python text_normalizer.py --check 校验）。
+    """
+    return normalize_text(text)
 
 def is_meaningful_text(text):
     """判断文本是否有意义（非乱码）"""
-    if len(text.strip()) < 50:
-        return False
-    
-    # 统计字母数量
     letters = sum(1 for c in text if c.isalpha())
-    total_chars = len(text)
+    return _is_meaningful(len(text.strip()), len(text), letters, Counter(text.lower()))
+
+def is_meaningful_page(text):
+    """判断单页文本层能否直接使用（否则OCR）
+
+    50 个字符以上的页面沿用 is_meaningful_text；标题、图注、分节页等短页面
+    只要求文本干净：没有替换字符或控制字符，且非空白字符以字母为主。
+    """
+    stripped = text.strip()
+    if not stripped:
+        return False
+    if len(stripped) >= 50:
+        return is_meaningful_text(text)
+    visible = [c for c in stripped if not c.isspace()]
+    if any(c == '\ufffd' or unicodedata.category(c) in ('Cc', 'Co') for c in visible):
+        return False
+    return sum(1 for c in visible if c.isalpha()) / len(visible) >= 0.5
+
+def _is_meaningful(stripped_length, total_chars, letters, char_counts):
+    """is_meaningful_text 的判断规则，输入为文本的统计量"""
+    if stripped_length < 50:
+        return False
     
     # 如果字母占比太低，可能是乱码
     if total_chars > 0 and letters / total_chars < 0.5:
         return False
     
     # 检查是否有过多重复字符
-    char_counts = Counter(text.lower())
     most_common_char_count = char_counts.most_common(1)[0][1] if char_counts else 0
-    if most_common_char_count > len(text) * 0.3:  # 如果某个字符占比超过30%
+    if most_common_char_count > total_chars * 0.3:  # 如果某个字符占比超过30%
         return False
     
     return True
 
-def extract_text_from_pdf(pdf_path):
-    """使用PyMuPDF提取文本"""
-    text = ""
+def _new_text_stats():
+    """逐块累计整篇文本（去掉首尾空白后）的统计量"""
+    return {'chars': 0, 'letters': 0, 'counts': Counter(), 'held': ''}
+
+def _add_text_stats(stats, chunk):
+    # 结尾空白先暂存，后面还有内容时才计入，等价于对拼接结果 strip()
+    if not stats['chars']:
+        chunk = chunk.lstrip()
+    body = chunk.rstrip()
+    if not body:
+        if stats['chars']:
+            stats['held'] += chunk
+        return
+    counted = stats['held'] + body
+    stats['held'] = chunk[len(body):]
+    stats['chars'] += len(counted)
+    stats['letters'] += sum(1 for c in counted if c.isalpha())
+    stats['counts'].update(counted.lower())
+
+def _text_stats_meaningful(stats):
+    """与对整篇文本调用 is_meaningful_text 的结果相同"""
+    return _is_meaningful(stats['chars'], stats['chars'], stats['letters'], stats['counts'])
+
+def extraction_settings(dpi=OCR_DPI):
+    """影响页面提取结果的参数，作为页面缓存键的一部分"""
+    return settings_key(dpi=dpi, ocr_config=OCR_CONFIG, lang='eng')
+
+def iter_pdf_pages(pdf_path, workers=OCR_WORKERS, dpi=OCR_DPI, cache=None, pdf_hash=None, stats=None):
+    """逐页混合提取，按页码顺序逐页产出 (页码, 文本)
+
+    有效文本页直接用PyMuPDF的文本层，扫描或乱码页提交给OCR进程池，
+    在途页面最多 2 * workers 页。传入 cache（extraction_cache 连接）时，
+    已缓存的页面直接复用。stats 字典记录页数、OCR页数和缓存命中页数。
+    """
+    if stats is None:
+        stats = {}
+    stats.update(pages=0, ocr=0, cached=0)
+    settings = extraction_settings(dpi)
+    cached_pages = {}
+    if cache is not None:
+        pdf_hash = pdf_hash or file_hash(pdf_path)
+        cached_pages = get_pages(cache, pdf_hash, settings)
+    
+    pool = None
+    window = deque()  # (页码, 原始文本, OCR文本 / OCR任务 / None)
+    new_pages = {}
+    
+    def resolve(page_num, raw_text, ocr_result):
+        ocr_text = ocr_result
+        if isinstance(ocr_result, Future):
+            _, ocr_text, error = ocr_result.result()
+            if error is not None:
+                print(f"⚠️ 第{page_num}页OCR失败：{error}")
+                ocr_text = None
+            else:
+                print(f"🔍 OCR 第 {page_num} 页完成")
+        if page_num not in cached_pages and (ocr_text is not None or not isinstance(ocr_result, Future)):
+            # OCR 失败的页面不缓存，下次重试
+            new_pages[page_num] = (raw_text, ocr_text)
+        stats['pages'] += 1
+        if ocr_text is not None:
+            stats['ocr'] += 1
+            # OCR 结果也无效时保留原文本层
+            if is_meaningful_page(ocr_text):
+                return page_num, ocr_text
+        return page_num, raw_text
+    
+    def flush_cache():
+        if cache is not None and new_pages:
+            put_pages(cache, pdf_hash, settings, new_pages)
+            new_pages.clear()
+    
     try:
-        with fitz.open(pdf_path) as doc:
-            for page_num, page in enumerate(doc):
-                page_text = page.get_text()
-                if page_text.strip():  # 只添加非空页面
-                    text += f"\n--- Page {page_num + 1} ---\n"
-                    text += page_text
+        doc = fitz.open(pdf_path)
     except Exception as e:
         print(f"❌ PyMuPDF 提取失败：{e}")
-        return ""
-    
-    return text.strip()
+        return
+    try:
+        for page_num, page in enumerate(doc, 1):
+            if page_num in cached_pages:
+                stats['cached'] += 1
+                window.append((page_num, *cached_pages[page_num]))
+            else:
+                raw_text = page.get_text()
+                if is_meaningful_page(raw_text):
+                    window.append((page_num, raw_text, None))
+                else:
+                    if pool is None:
+                        # 页面在工作进程中渲染，图片不经过进程间传递
+                        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker,
+                                                   initargs=(pdf_path,))
+                    window.append((page_num, raw_text, pool.submit(_ocr_page, page_num, dpi)))
+            
+            # 队首页面就绪（或在途页面过多）时按顺序产出
+            while window and (len(window) > 2 * workers or not isinstance(window[0][2], Future)
+                              or window[0][2].done()):
+                yield resolve(*window.popleft())
+            if len(new_pages) >= 32:
+                flush_cache()
+        while window:
+            yield resolve(*window.popleft())
+    finally:
+        doc.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        flush_cache()
+
+def _extraction_method(stats):
+    """根据 iter_pdf_pages 的统计生成提取方法说明"""
+    if not stats['ocr']:
+        return "PyMuPDF"
+    if stats['ocr'] == stats['pages']:
+        return "OCR"
+    return f"混合（PyMuPDF {stats['pages'] - stats['ocr']} 页，OCR {stats['ocr']} 页）"
 
-def ocr_pdf(pdf_path):
-    """使用OCR提取文本"""
-    print(f"🖼️ OCR 模式：转换 {pdf_path} 为图片")
+# 每个OCR工作进程打开一次PDF
+_worker_doc = None
+
+def _init_ocr_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+def _ocr_page(page_num, dpi):
+    """在工作进程中用PyMuPDF渲染单页并OCR"""
     try:
-        # 尝试不同的DPI设置
-        images = convert_from_path(pdf_path, dpi=300, first_page=1, last_page=3)  # 先测试前3页
-        if not images:
-            return ""
+        pix = _worker_doc[page_num - 1].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return page_num, pytesseract.image_to_string(image, lang='eng', config=OCR_CONFIG), None
     except Exception as e:
-        print(f"❌ PDF 转图片失败：{e}")
-        return ""
-    
-    text = ""
-    for i, image in enumerate(images):
-        print(f"🔍 OCR 第 {i+1} 页")
-        try:
-            # 使用更好的OCR配置
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,!?;:()[]"\'- '
-            page_text = pytesseract.image_to_string(image, lang='eng', config=custom_config)
-            if page_text.strip():
-                text += f"\n--- Page {i + 1} ---\n"
-                text += page_text + "\n"
-        except Exception as e:
-            print(f"⚠️ 第{i+1}页OCR失败：{e}")
+        return page_num, "", e
+
+# 跨块缓冲的句子超过该长度时直接放出（反正会被长度过滤掉），保证内存有界
+MAX_CARRY_CHARS = 100000
+
+def _keep_sentence(sentence):
+    """过滤太短、太长的句子和页眉页脚"""
+    # 过滤太短或太长的句子
+    if not 10 <= len(sentence) <= 1000:
+        return False
+    # 移除可能的页眉页脚模式
+    return not re.match(r'^(Page \d+|\d+|Chapter \d+)', sentence)
+
+def iter_sentences(chunks):
+    """流式句子分割：文本块 -> 清理 -> 分句 -> 过滤
+
+    每块清理后的文本与上一块未结束的最后一句拼接后再分句，
+    跨页的句子不会被切断。
+    """
+    carry = ""
+    for piece in normalize_stream(chunks):
+        sentences = sent_tokenize(carry + piece)
+        if not sentences:
             continue
-    
-    return text.strip()
+        # 最后一句可能在下一块继续
+        carry = sentences.pop()
+        if len(carry) > MAX_CARRY_CHARS:
+            sentences.append(carry)
+            carry = ""
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if _keep_sentence(sentence):
+                yield sentence
+    carry = carry.strip()
+    if carry and _keep_sentence(carry):
+        yield carry
 
 def process_sentences(text):
-    """处理句子分割和清理"""
+    """处理句子分割和清理（整段文本）"""
     # 清理文本
     cleaned_text = clean_text(text)
     
-    # 句子分割
-    sentences = sent_tokenize(cleaned_text)
-    
-    # 过滤和清理句子
-    processed_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        # 过滤太短或太长的句子
-        if 10 <= len(sentence) <= 1000:
-            # 移除可能的页眉页脚模式
-            if not re.match(r'^(Page \d+|\d+|Chapter \d+)', sentence):
-                processed_sentences.append(sentence)
-    
-    return processed_sentences
+    # 句子分割、过滤和清理
+    sentences = (sentence.strip() for sentence in sent_tokenize(cleaned_text))
+    return [sentence for sentence in sentences if _keep_sentence(sentence)]
+
+def _page_chunks(pages, text_stats):
+    """把 (页码, 文本) 转成带页码标记的文本块，并累计整篇文本统计"""
+    for page_num, page_text in pages:
+        if page_text.strip():  # 只添加非空页面
+            chunk = f"\n--- Page {page_num} ---\n" + page_text
+            _add_text_stats(text_stats, chunk)
+            yield chunk
 
-def process_pdf_smart(folder_path):
-    """智能处理PDF文件夹"""
+def process_pdf_smart(folder_path, output_folder=output_folder, workers=OCR_WORKERS,
+                      cache_path=cache_path, max_cache_bytes=DEFAULT_MAX_BYTES):
+    """智能处理PDF文件夹
+
+    cache_path 为 None 时不使用缓存。
+    """
     pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".pdf")]
     
     if not pdf_files:
@@ -145,49 +281,93 @@ def process_pdf_smart(folder_path):
         return
     
     print(f"📚 找到 {len(pdf_files)} 个PDF文件")
+    os.makedirs(output_folder, exist_ok=True)
+    
+    cache = None
+    if cache_path:
+        cache = open_cache(cache_path)
+        # 清理规则变化后，旧版本的输出记录失效
+        invalidate(cache, CLEAN_TEXT_VERSION)
+    settings = extraction_settings()
     
     for filename in pdf_files:
         pdf_path = os.path.join(folder_path, filename)
+        output_file = os.path.join(output_folder, filename.replace(".pdf", ".txt"))
         print(f"\n📘 正在处理：{filename}")
         
-        # 先尝试普通提取
-        text = extract_text_from_pdf(pdf_path)
-        method = "PyMuPDF"
-        
-        # 判断是否需要OCR
-        if not is_meaningful_text(text):
-            print("⚠️ 文本提取失败或质量差，切换为 OCR...")
-            text = ocr_pdf(pdf_path)
-            method = "OCR"
-            
-            # 如果OCR也失败
-            if not is_meaningful_text(text):
-                print("❌ OCR 也未能提取到有效文本")
+        pdf_hash = None
+        if cache is not None:
+            pdf_hash = file_hash(pdf_path)
+            if is_document_current(cache, pdf_hash, settings, CLEAN_TEXT_VERSION, output_file):
+                print(f"⏭️ 未变化，跳过：{output_file}")
                 continue
         
-        # 处理句子
-        sentences = process_sentences(text)
-        
-        if not sentences:
-            print("⚠️ 未提取到有效句子")
-            continue
-        
-        # 保存结果
-        output_file = os.path.join(output_folder, filename.replace(".pdf", ".txt"))
+        # 逐页提取（只对质量差的页面OCR）、清理、分句，边处理边写入
+        stats = {}
+        text_stats = _new_text_stats()
+        pages = iter_pdf_pages(pdf_path, workers=workers, cache=cache, pdf_hash=pdf_hash, stats=stats)
+        part_file = output_file + ".part"
+        sentence_count = 0
         try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(f"# 文件：{filename}\n")
-                f.write(f"# 提取方法：{method}\n")
-                f.write(f"# 句子数量：{len(sentences)}\n\n")
-                
-                for sentence in sentences:
+            # 出错时也立即关闭页面生成器，让它在 cache.close() 之前写入本次新提取的页面
+            with closing(pages), open(part_file, "w", encoding="utf-8") as f:
+                f.write(f"# 文件：{filename}\n\n")
+                for sentence in iter_sentences(_page_chunks(pages, text_stats)):
                     f.write(f"{sentence}\n")
-            
-            print(f"✅ 使用 {method}，提取 {len(sentences)} 个句子，已保存：{output_file}")
-            
+                    sentence_count += 1
+                # 提取方法和句子数量要等全部页面处理完才知道，写在文件末尾
+                method = _extraction_method(stats)
+                f.write(f"\n# 提取方法：{method}\n")
+                f.write(f"# 句子数量：{sentence_count}\n")
         except Exception as e:
             print(f"❌ 保存文件失败：{e}")
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            continue
+        
+        if stats.get('cached'):
+            print(f"♻️ 复用缓存页面 {stats['cached']}/{stats['pages']} 页")
+        if not _text_stats_meaningful(text_stats):
+            print("❌ 未能提取到有效文本")
+            os.remove(part_file)
+            continue
+        if not sentence_count:
+            print("⚠️ 未提取到有效句子")
+            os.remove(part_file)
+            continue
+        
+        os.replace(part_file, output_file)
+        print(f"✅ 使用 {method}，提取 {sentence_count} 个句子，已保存：{output_file}")
+        
+        if cache is not None:
+            put_document(cache, pdf_hash, settings, CLEAN_TEXT_VERSION, output_file, sentence_count)
+    
+    if cache is not None:
+        evicted = evict(cache, max_cache_bytes)
+        if evicted:
+            print(f"🧹 缓存超过上限，淘汰 {evicted} 个页面")
+        cache.close()
 
 # 运行处理
 if __name__ == "__main__":
-    process_pdf_smart(folder_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="PDF 文本提取与句子分割")
+    parser.add_argument("--folder", default=folder_path, help="PDF 所在文件夹（某一年份）")
+    parser.add_argument("--output", default=None, help="句子输出文件夹（默认：<folder>/smart_extracted_sentences）")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help="OCR 进程数")
+    parser.add_argument("--cache", default=None, help="提取缓存数据库路径（默认放在 <folder> 的上一级）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用提取缓存")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2,
+                        help="页面缓存上限（MB）")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="运行前清空缓存（包括页面文本和OCR结果）")
+    args = parser.parse_args()
+    
+    output_folder = args.output or os.path.join(args.folder, "smart_extracted_sentences")
+    cache_path = args.cache or os.path.join(os.path.dirname(os.path.abspath(args.folder)), ".extraction_cache.sqlite")
+    if args.clear_cache and not args.no_cache:
+        conn = open_cache(cache_path)
+        print(f"🧹 已清除 {invalidate(conn, pages=True)} 条缓存记录")
+        conn.close()
+    process_pdf_smart(args.folder, output_folder, workers=args.workers,
+                      cache_path=None if args.no_cache else cache_path,
+                      max_cache_bytes=args.cache_max_mb * 1024 ** 2)
@@ -0,0 +1,187 @@
+import os
+import glob
+import json
+import time
+import heapq
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from annotation_records import iter_tasks
+from ner_inference import load_ner_pipeline, model_name, read_records, doc_to_task
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+
+BEAM_WIDTH = 16
+CHUNK_SIZE = 1000  # sentences sent to a worker at a time
+
+def text_hash(text):
+    """64-bit hash of a sentence with whitespace normalized"""
+    return hashlib.blake2b(" ".join(text.split()).encode('utf-8'), digest_size=8).digest()
+
+def checked_hashes(annotation_dir):
+    """Hashes of every sentence already in the checked annotation files, whatever the answer"""
+    hashes = set()
+    for jsonl_path in sorted(glob.glob(os.path.join(annotation_dir, "*.jsonl"))):
+        for task in iter_tasks(jsonl_path):
+            hashes.add(text_hash(task.text))
+    return hashes
+
+def beam_scores(nlp, texts, beam_width=BEAM_WIDTH, batch_size=256):
+    """(uncertainty, entities) per text from the beam of the pipeline's ner
+
+    Each candidate entity's probability is the summed probability of the
+    beam parses containing it. A text is as uncertain as its least certain
+    candidate: 1.0 for an entity at p = 0.5, 0.0 when every candidate is
+    (almost) surely in or out. Entities with p > 0.5 never overlap and are
+    returned as the pre-highlighted spans (character offsets).
+    """
+    ner = nlp.get_pipe("ner")
+    results = []
+    # Run everything before ner (e.g. a shared tok2vec) the usual way, then beam-parse
+    docs = list(nlp.pipe(texts, disable=["ner"], batch_size=batch_size))
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        for doc, scores in zip(batch, ner.scored_ents(ner.beam_parse(batch, beam_width=beam_width))):
+            uncertainty = max((1 - abs(2 * min(p, 1.0) - 1) for p in scores.values()), default=0.0)
+            entities = sorted((doc[s:e].start_char, doc[s:e].end_char, label)
+                              for (s, e, label), p in scores.items() if p > 0.5)
+            results.append((uncertainty, entities))
+    return results
+
+def disagreement_scores(models, texts, batch_size=256):
+    """(disagreement, entities) per text from several pipelines
+
+    Disagreement is 1 - the mean pairwise Jaccard similarity of the models'
+    entity sets (character offsets and label). Entities predicted by more
+    than half of the models are returned as the pre-highlighted spans.
+    """
+    predictions = [[{(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents}
+                    for doc in nlp.pipe(texts, batch_size=batch_size)] for nlp in models]
+    results = []
+    for per_model in zip(*predictions):
+        similarities = [len(a & b) / len(a | b) if a or b else 1.0 for a, b in combinations(per_model, 2)]
+        votes = {}
+        for entities in per_model:
+            for entity in entities:
+                votes[entity] = votes.get(entity, 0) + 1
+        majority = sorted(entity for entity, count in votes.items() if count * 2 > len(per_model))
+        results.append((1 - sum(similarities) / len(similarities), majority))
+    return results
+
+_worker_models = None
+
+def _init_worker(model_paths):
+    global _worker_models
+    _worker_models = [load_ner_pipeline(path) for path in model_paths]
+
+def _score_chunk(texts, beam_width, batch_size):
+    if len(_worker_models) > 1:
+        return disagreement_scores(_worker_models, texts, batch_size)
+    return beam_scores(_worker_models[0], texts, beam_width, batch_size)
+
+def iter_chunks(records, skip, chunk_size=CHUNK_SIZE, stats=None):
+    """Lists of (line number, text, meta), leaving out texts whose hash is in skip"""
+    chunk = []
+    for number, (text, meta) in enumerate(records, 1):
+        if text_hash(text) in skip:
+            if stats is not None:
+                stats['skipped'] += 1
+            continue
+        chunk.append((number, text, meta))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_scored(model_paths, chunks, workers=1, beam_width=BEAM_WIDTH, batch_size=256):
+    """(line number, text, meta, score, entities) for every record, in input order
+
+    With workers > 1 each process loads the models once and scores whole
+    chunks; at most 2 * workers chunks are in flight at a time.
+    """
+    if workers <= 1:
+        _init_worker(model_paths)
+        for chunk in chunks:
+            scores = _score_chunk([text for _, text, _ in chunk], beam_width, batch_size)
+            for (number, text, meta), (score, entities) in zip(chunk, scores):
+                yield number, text, meta, score, entities
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_paths,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_score_chunk, [text for _, text, _ in chunk],
+                                               beam_width, batch_size)))
+            while pending and (len(pending) >= 2 * workers or pending[0][1].done()):
+                chunk_done, future = pending.popleft()
+                for (number, text, meta), (score, entities) in zip(chunk_done, future.result()):
+                    yield number, text, meta, score, entities
+        while pending:
+            chunk_done, future = pending.popleft()
+            for (number, text, meta), (score, entities) in zip(chunk_done, future.result()):
+                yield number, text, meta, score, entities
+
+def rank(model_paths, input_path, output_path, top_k=1000, annotation_dir=DEFAULT_ANNOTATIONS,
+         workers=1, beam_width=BEAM_WIDTH, batch_size=256, chunk_size=CHUNK_SIZE):
+    """Write the top_k most uncertain unannotated sentences as Prodigy JSONL, most uncertain first"""
+    start = time.time()
+    skip = checked_hashes(annotation_dir) if annotation_dir else set()
+    print(f"Loaded {len(skip)} annotated sentence hashes in {time.time() - start:.1f}s")
+
+    mode = "disagreement" if len(model_paths) > 1 else "beam"
+    stats = {'skipped': 0}
+    heap = []  # (score, -line number, text, meta, entities), lowest score on top
+    scored = 0
+    start = time.time()
+    chunks = iter_chunks(read_records(input_path), skip, chunk_size, stats)
+    for number, text, meta, score, entities in iter_scored(model_paths, chunks, workers, beam_width, batch_size):
+        item = (score, -number, text, meta, entities)
+        if len(heap) < top_k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+        scored += 1
+        if scored % 100000 == 0:
+            print(f"  {scored} sentences scored ({scored / (time.time() - start):.0f}/s)")
+    elapsed = time.time() - start
+    print(f"Scored {scored} sentences ({stats['skipped']} already annotated, skipped) "
+          f"in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.0f}/s)")
+
+    # Only the selected sentences are tokenized again for the output tasks
+    nlp = load_ner_pipeline(model_paths[0])
+    source = "+".join(model_name(path) for path in model_paths)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for score, negative_number, text, meta, entities in sorted(heap, reverse=True):
+            doc = nlp.make_doc(text)
+            spans = [doc.char_span(s, e, label=label) for s, e, label in entities]
+            doc.ents = [span for span in spans if span is not None]
+            meta = dict(meta, score=round(score, 4), line=-negative_number, sorter=mode)
+            out.write(json.dumps(doc_to_task(doc, source, meta), ensure_ascii=False) + "\n")
+    print(f"Wrote the {len(heap)} most uncertain sentences ({mode}) to {output_path}")
+    return len(heap), scored
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank unannotated sentences by model uncertainty for Prodigy")
+    parser.add_argument("input", help="Sentence file (one per line) or JSONL with a \"text\" field")
+    parser.add_argument("output", help="Prodigy JSONL of the top-k sentences, most uncertain first")
+    parser.add_argument("--model", nargs="+", required=True,
+                        help="One pipeline (beam uncertainty) or several (disagreement), e.g. model_04/model-best")
+    parser.add_argument("--top-k", type=int, default=1000)
+    parser.add_argument("--annotations", default=DEFAULT_ANNOTATIONS,
+                        help="Sentences in these JSONL files are skipped ('' to skip nothing)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--beam-width", type=int, default=BEAM_WIDTH)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Sentences per worker task")
+    args = parser.parse_args()
+
+    rank(args.model, args.input, args.output, args.top_k, args.annotations,
+         args.workers, args.beam_width, args.batch_size, args.chunk_size)
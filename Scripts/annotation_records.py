@@ -0,0 +1,143 @@
+import json
+from typing import List, Optional
+
+try:
+    import msgspec
+except ImportError:  # optional: pip install msgspec
+    msgspec = None
+
+# Typed records for Prodigy ner_manual tasks. With msgspec installed each JSONL
+# line is decoded and validated straight into slotted structs in one C pass;
+# otherwise json.loads is followed by the same checks in Python. Either way a
+# malformed record raises a ValueError naming the offending field, e.g.
+# "Expected `int`, got `str` - at `$.tokens[3].start`". Unknown keys such as
+# _is_binary are ignored.
+
+if msgspec is not None:
+
+    class Token(msgspec.Struct):
+        text: str
+        start: int
+        end: int
+        id: Optional[int] = None
+        ws: bool = True
+
+    class Span(msgspec.Struct):
+        start: int
+        end: int
+        label: str
+        token_start: Optional[int] = None
+        token_end: Optional[int] = None
+        text: Optional[str] = None
+
+    class Task(msgspec.Struct):
+        text: str = ""
+        answer: str = ""
+        tokens: Optional[List[Token]] = None
+        spans: List[Span] = []
+        meta: dict = {}
+        input_hash: Optional[int] = msgspec.field(default=None, name="_input_hash")
+        task_hash: Optional[int] = msgspec.field(default=None, name="_task_hash")
+        timestamp: Optional[int] = msgspec.field(default=None, name="_timestamp")
+        view_id: Optional[str] = msgspec.field(default=None, name="_view_id")
+
+    decode_task = msgspec.json.Decoder(Task).decode
+
+else:
+
+    class Token:
+        __slots__ = ("text", "start", "end", "id", "ws")
+
+        def __init__(self, text, start, end, id=None, ws=True):
+            self.text, self.start, self.end, self.id, self.ws = text, start, end, id, ws
+
+    class Span:
+        __slots__ = ("start", "end", "label", "token_start", "token_end", "text")
+
+        def __init__(self, start, end, label, token_start=None, token_end=None, text=None):
+            self.start, self.end, self.label = start, end, label
+            self.token_start, self.token_end, self.text = token_start, token_end, text
+
+    class Task:
+        __slots__ = ("text", "answer", "tokens", "spans", "meta",
+                     "input_hash", "task_hash", "timestamp", "view_id")
+
+        def __init__(self, text="", answer="", tokens=None, spans=(), meta=None,
+                     input_hash=None, task_hash=None, timestamp=None, view_id=None):
+            self.text, self.answer, self.tokens = text, answer, tokens
+            self.spans, self.meta = list(spans), meta if meta is not None else {}
+            self.input_hash, self.task_hash = input_hash, task_hash
+            self.timestamp, self.view_id = timestamp, view_id
+
+    _TYPE_NAMES = {str: "str", int: "int", bool: "bool", list: "array", dict: "object",
+                   float: "float", type(None): "null"}
+
+    def _field(data, key, kind, path, default=None, required=False, optional=True):
+        """Fetch data[key] and check its JSON type the way msgspec would"""
+        if key not in data:
+            if required:
+                raise ValueError(f"Object missing required field `{key}` - at `{path}`")
+            return default
+        value = data[key]
+        if value is None and optional:
+            return None
+        # bool is a subclass of int, but JSON true/false is not a valid integer
+        if type(value) is not kind:
+            raise ValueError(f"Expected `{_TYPE_NAMES[kind]}`, got "
+                             f"`{_TYPE_NAMES.get(type(value), type(value).__name__)}` - at `{path}.{key}`")
+        return value
+
+    def _token(data, path):
+        if type(data) is not dict:
+            raise ValueError(f"Expected `object`, got `{_TYPE_NAMES.get(type(data), 'value')}` - at `{path}`")
+        return Token(_field(data, "text", str, path, required=True, optional=False),
+                     _field(data, "start", int, path, required=True, optional=False),
+                     _field(data, "end", int, path, required=True, optional=False),
+                     _field(data, "id", int, path),
+                     _field(data, "ws", bool, path, default=True, optional=False))
+
+    def _span(data, path):
+        if type(data) is not dict:
+            raise ValueError(f"Expected `object`, got `{_TYPE_NAMES.get(type(data), 'value')}` - at `{path}`")
+        return Span(_field(data, "start", int, path, required=True, optional=False),
+                    _field(data, "end", int, path, required=True, optional=False),
+                    _field(data, "label", str, path, required=True, optional=False),
+                    _field(data, "token_start", int, path),
+                    _field(data, "token_end", int, path),
+                    _field(data, "text", str, path))
+
+    def decode_task(line):
+        """Decode and validate one JSONL line into a Task"""
+        data = json.loads(line)
+        if type(data) is not dict:
+            raise ValueError(f"Expected `object`, got `{_TYPE_NAMES.get(type(data), 'value')}`")
+        tokens = _field(data, "tokens", list, "$")
+        spans = _field(data, "spans", list, "$", default=[], optional=False)
+        return Task(
+            text=_field(data, "text", str, "$", default="", optional=False),
+            answer=_field(data, "answer", str, "$", default="", optional=False),
+            tokens=None if tokens is None else [_token(t, f"$.tokens[{i}]") for i, t in enumerate(tokens)],
+            spans=[_span(s, f"$.spans[{i}]") for i, s in enumerate(spans)],
+            meta=_field(data, "meta", dict, "$", default={}, optional=False),
+            input_hash=_field(data, "_input_hash", int, "$"),
+            task_hash=_field(data, "_task_hash", int, "$"),
+            timestamp=_field(data, "_timestamp", int, "$"),
+            view_id=_field(data, "_view_id", str, "$"))
+
+def iter_tasks(jsonl_path, stats=None):
+    """Yield the Tasks in a Prodigy JSONL export, reporting and skipping invalid lines
+
+    stats, if given, counts them in stats["skipped"].
+    """
+    if stats is not None:
+        stats.setdefault("skipped", 0)
+    with open(jsonl_path, 'rb') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield decode_task(line)
+            except ValueError as e:
+                print(f"Error parsing line {line_num} in {jsonl_path}: {e}")
+                if stats is not None:
+                    stats["skipped"] += 1
@@ -0,0 +1,261 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from array import array
+import numpy as np
+from annotation_records import iter_tasks
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_STORE = os.path.join(PROJECT_DIR, "annotation_store")
+
+# Bumped whenever the layout changes, so older stores are rebuilt
+STORE_VERSION = 2
+
+# Column name -> array typecode used while building (the .npy dtype follows from it).
+# Records without a hash store 0 with has_<hash> False; 0 is itself a valid hash.
+RECORD_COLUMNS = {"dataset": "h", "answer": "b", "input_hash": "q", "task_hash": "q", "timestamp": "q",
+                  "has_input_hash": "b", "has_task_hash": "b"}
+TOKEN_COLUMNS = {"token_start": "i", "token_end": "i", "token_ws": "b"}
+SPAN_COLUMNS = {"span_record": "i", "span_start": "i", "span_end": "i",
+                "span_token_start": "i", "span_token_end": "i", "span_label": "h"}
+
+def _code(vocab, value):
+    """Dictionary-encode a string, growing the vocabulary as needed"""
+    code = vocab.get(value)
+    if code is None:
+        code = vocab[value] = len(vocab)
+    return code
+
+def build_store(jsonl_paths, store_dir):
+    """Convert Prodigy JSONL exports into one columnar store of .npy arrays
+
+    Records, tokens and spans each become a set of parallel arrays. Token and
+    span rows of record i are token_offset[i]:token_offset[i + 1] (likewise
+    for spans). Text is kept as one UTF-8 blob, addressed by text_offset, so
+    it is only touched by queries that ask for it. Labels, answers and dataset
+    names are dictionary-encoded; both hash columns get a sorted index and a
+    presence mask, since a record may lack a hash.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    columns = {name: array(code) for name, code in {**RECORD_COLUMNS, **TOKEN_COLUMNS, **SPAN_COLUMNS}.items()}
+    token_offset, span_offset, text_offset = array('q', [0]), array('q', [0]), array('q', [0])
+    labels, answers, datasets = {}, {}, {}
+
+    with open(os.path.join(store_dir, "text.bin"), 'wb') as text_blob:
+        for jsonl_path in jsonl_paths:
+            dataset = _code(datasets, os.path.splitext(os.path.basename(jsonl_path))[0])
+            for task in iter_tasks(jsonl_path):
+                record = len(text_offset) - 1
+                columns["dataset"].append(dataset)
+                columns["answer"].append(_code(answers, task.answer))
+                columns["input_hash"].append(task.input_hash or 0)
+                columns["task_hash"].append(task.task_hash or 0)
+                columns["has_input_hash"].append(task.input_hash is not None)
+                columns["has_task_hash"].append(task.task_hash is not None)
+                columns["timestamp"].append(task.timestamp or 0)
+
+                for token in task.tokens or ():
+                    columns["token_start"].append(token.start)
+                    columns["token_end"].append(token.end)
+                    columns["token_ws"].append(token.ws)
+                for span in task.spans:
+                    columns["span_record"].append(record)
+                    columns["span_start"].append(span.start)
+                    columns["span_end"].append(span.end)
+                    columns["span_token_start"].append(-1 if span.token_start is None else span.token_start)
+                    columns["span_token_end"].append(-1 if span.token_end is None else span.token_end)
+                    columns["span_label"].append(_code(labels, span.label))
+
+                encoded = task.text.encode('utf-8')
+                text_blob.write(encoded)
+                text_offset.append(text_offset[-1] + len(encoded))
+                token_offset.append(len(columns["token_start"]))
+                span_offset.append(len(columns["span_start"]))
+
+    arrays = {name: np.frombuffer(values, dtype=values.typecode) if len(values) else
+              np.zeros(0, dtype=values.typecode) for name, values in columns.items()}
+    for name in ("token_ws", "has_input_hash", "has_task_hash"):
+        arrays[name] = arrays[name].astype(bool)
+    arrays["token_offset"] = np.frombuffer(token_offset, dtype=np.int64)
+    arrays["span_offset"] = np.frombuffer(span_offset, dtype=np.int64)
+    arrays["text_offset"] = np.frombuffer(text_offset, dtype=np.int64)
+    arrays["input_hash_order"] = np.argsort(arrays["input_hash"], kind='stable')
+    arrays["task_hash_order"] = np.argsort(arrays["task_hash"], kind='stable')
+    for name, values in arrays.items():
+        np.save(os.path.join(store_dir, f"{name}.npy"), values)
+
+    meta = {
+        "version": STORE_VERSION,
+        "labels": list(labels), "answers": list(answers), "datasets": list(datasets),
+        "sources": {os.path.abspath(p): os.path.getmtime(p) for p in jsonl_paths},
+        "records": len(text_offset) - 1,
+    }
+    with open(os.path.join(store_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+def is_store_current(store_dir, jsonl_paths):
+    """True if the store has the current layout, was built from exactly these files and none changed since"""
+    try:
+        with open(os.path.join(store_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        version, sources = meta.get("version"), meta["sources"]
+    except (OSError, ValueError, KeyError):
+        return False
+    return version == STORE_VERSION and sources == {os.path.abspath(p): os.path.getmtime(p) for p in jsonl_paths}
+
+class AnnotationStore:
+    """Read-only, memory-mapped view of a store written by build_store"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.labels = self.meta["labels"]
+        self.answers = self.meta["answers"]
+        self.datasets = self.meta["datasets"]
+        self._arrays = {}
+
+    def __len__(self):
+        return self.meta["records"]
+
+    def __getattr__(self, name):
+        # Columns are memory-mapped on first use
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._arrays:
+            path = os.path.join(self.store_dir, f"{name}.npy")
+            if not os.path.exists(path):
+                raise AttributeError(name)
+            self._arrays[name] = np.load(path, mmap_mode='r')
+        return self._arrays[name]
+
+    def _codes(self, vocab, values):
+        if isinstance(values, str):
+            values = [values]
+        return [vocab.index(value) for value in values if value in vocab]
+
+    def select(self, label=None, answer=None, dataset=None):
+        """Record indices matching every given filter (each a name or list of names)"""
+        mask = np.ones(len(self), dtype=bool)
+        if answer is not None:
+            mask &= np.isin(self.answer, self._codes(self.answers, answer))
+        if dataset is not None:
+            mask &= np.isin(self.dataset, self._codes(self.datasets, dataset))
+        if label is not None:
+            with_label = np.isin(self.span_label, self._codes(self.labels, label))
+            has_label = np.zeros(len(self), dtype=bool)
+            has_label[self.span_record[with_label]] = True
+            mask &= has_label
+        return np.flatnonzero(mask)
+
+    def _lookup(self, column, order, present, value):
+        left = np.searchsorted(column, value, side='left', sorter=order)
+        right = np.searchsorted(column, value, side='right', sorter=order)
+        records = order[left:right]
+        # Records without the hash also hold 0 in the column
+        return np.sort(records[present[records]])
+
+    def by_input_hash(self, value):
+        return self._lookup(self.input_hash, self.input_hash_order, self.has_input_hash, value)
+
+    def by_task_hash(self, value):
+        return self._lookup(self.task_hash, self.task_hash_order, self.has_task_hash, value)
+
+    def text(self, record):
+        start, end = self.text_offset[record], self.text_offset[record + 1]
+        with open(os.path.join(self.store_dir, "text.bin"), 'rb') as f:
+            f.seek(int(start))
+            return f.read(int(end - start)).decode('utf-8')
+
+    def spans(self, record):
+        """(start, end, label) character spans of one record"""
+        rows = slice(self.span_offset[record], self.span_offset[record + 1])
+        return [(int(start), int(end), self.labels[label]) for start, end, label in
+                zip(self.span_start[rows], self.span_end[rows], self.span_label[rows])]
+
+    def _span_rows(self, records):
+        if records is None:
+            return slice(None)
+        return np.isin(self.span_record, records)
+
+    def label_counts(self, records=None):
+        """{label: number of spans} over all records or the given record indices"""
+        counts = np.bincount(self.span_label[self._span_rows(records)], minlength=len(self.labels))
+        return {label: int(count) for label, count in zip(self.labels, counts)}
+
+    def span_stats(self, records=None):
+        """Per label: span count, mean length in tokens and characters, records containing it"""
+        rows = self._span_rows(records)
+        label = np.asarray(self.span_label[rows])
+        tokens = np.asarray(self.span_token_end[rows] - self.span_token_start[rows] + 1)
+        chars = np.asarray(self.span_end[rows] - self.span_start[rows])
+        span_record = np.asarray(self.span_record[rows])
+        stats = {}
+        for code, name in enumerate(self.labels):
+            mask = label == code
+            if mask.any():
+                stats[name] = {
+                    "spans": int(mask.sum()),
+                    "mean_tokens": float(tokens[mask].mean()),
+                    "mean_chars": float(chars[mask].mean()),
+                    "records": int(len(np.unique(span_record[mask]))),
+                }
+        return stats
+
+def open_store(store_dir=DEFAULT_STORE, annotation_dir=DEFAULT_ANNOTATIONS):
+    """Open the store, rebuilding it first if the checked JSONL files changed"""
+    jsonl_paths = sorted(glob.glob(os.path.join(annotation_dir, "*.jsonl")))
+    if not is_store_current(store_dir, jsonl_paths):
+        start = time.time()
+        meta = build_store(jsonl_paths, store_dir)
+        print(f"Built store with {meta['records']} records in {time.time() - start:.2f}s")
+    return AnnotationStore(store_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar store and queries over the checked annotations")
+    parser.add_argument("command", choices=["build", "stats", "query"])
+    parser.add_argument("--annotations", default=DEFAULT_ANNOTATIONS, help="Directory of checked JSONL files")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Store directory")
+    parser.add_argument("--label", nargs="*", help="Only records with a span of these labels")
+    parser.add_argument("--answer", nargs="*", help="Only records with these answers")
+    parser.add_argument("--dataset", nargs="*", help="Only records from these files (name without .jsonl)")
+    parser.add_argument("--input-hash", type=int, help="Look up records by _input_hash")
+    parser.add_argument("--task-hash", type=int, help="Look up records by _task_hash")
+    parser.add_argument("--limit", type=int, default=20, help="Records to print for query")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        jsonl_paths = sorted(glob.glob(os.path.join(args.annotations, "*.jsonl")))
+        start = time.time()
+        meta = build_store(jsonl_paths, args.store)
+        print(f"Built store with {meta['records']} records from {len(jsonl_paths)} files "
+              f"in {time.time() - start:.2f}s")
+        sys.exit(0)
+
+    store = open_store(args.store, args.annotations)
+    start = time.time()
+    if args.input_hash is not None:
+        records = store.by_input_hash(args.input_hash)
+    elif args.task_hash is not None:
+        records = store.by_task_hash(args.task_hash)
+    else:
+        records = store.select(args.label, args.answer, args.dataset)
+    filtered = len(records) != len(store)
+
+    if args.command == "stats":
+        stats = store.span_stats(records if filtered else None)
+        elapsed = time.time() - start
+        print(f"{'label':12}{'spans':>8}{'records':>9}{'tokens':>8}{'chars':>8}")
+        for label, s in sorted(stats.items(), key=lambda item: -item[1]["spans"]):
+            print(f"{label:12}{s['spans']:>8}{s['records']:>9}{s['mean_tokens']:>8.2f}{s['mean_chars']:>8.1f}")
+        print(f"{len(records)} records, computed in {elapsed * 1000:.1f} ms")
+    else:
+        for record in records[:args.limit]:
+            print(f"[{store.datasets[store.dataset[record]]}] {store.text(record)}")
+            print(f"  {store.spans(record)}")
+        print(f"{len(records)} matching records ({(time.time() - start) * 1000:.1f} ms)")
@@ -0,0 +1,333 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from memory_usage import rss_mb, peak_rss_mb
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_SAMPLES = os.path.join(PROJECT_DIR, "benchmarks", "samples")
+DEFAULT_HISTORY = os.path.join(PROJECT_DIR, "benchmarks", "history.json")
+
+SAMPLE_RECORDS = 2000
+SAMPLE_SEED = 7
+XML_REPEAT = 10  # the XML sample repeats the sample texts to get a volume-sized file
+PDF_SENTENCES_PER_PAGE = 25
+BENCHMARKS = ("models", "text", "xml", "pdf")
+
+# ---------- Fixed sample corpora ----------
+
+def build_samples(sample_dir, annotation_dir=DEFAULT_ANNOTATIONS, records=SAMPLE_RECORDS, seed=SAMPLE_SEED):
+    """Write the sample corpora once; later runs reuse them so numbers stay comparable
+
+    sample.jsonl  records drawn from the checked JSONL files (seeded)
+    texts.txt     their texts, one per line
+    sample_en.xml the texts as <s>/<w> elements, XML_REPEAT times over
+    sample.pdf    the texts as a text-layer PDF (needs PyMuPDF)
+    """
+    os.makedirs(sample_dir, exist_ok=True)
+    jsonl_path = os.path.join(sample_dir, "sample.jsonl")
+    if not os.path.exists(jsonl_path):
+        lines = []
+        for path in sorted(glob.glob(os.path.join(annotation_dir, "*.jsonl"))):
+            with open(path, 'r', encoding='utf-8') as f:
+                lines.extend(line for line in f if line.strip())
+        lines = random.Random(seed).sample(lines, min(records, len(lines)))
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        print(f"Wrote {len(lines)} sample records to {jsonl_path}")
+
+    texts_path = os.path.join(sample_dir, "texts.txt")
+    if not os.path.exists(texts_path):
+        with open(jsonl_path, 'r', encoding='utf-8') as f, open(texts_path, 'w', encoding='utf-8') as out:
+            for line in f:
+                out.write(" ".join(json.loads(line)["text"].split()) + "\n")
+    texts = read_texts(texts_path)
+
+    xml_path = os.path.join(sample_dir, "sample_en.xml")
+    if not os.path.exists(xml_path):
+        from xml.sax.saxutils import escape
+        word_id = 0
+        with open(xml_path, 'w', encoding='utf-8') as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<text>\n')
+            for repeat in range(XML_REPEAT):
+                for s_id, text in enumerate(texts):
+                    out.write(f'<s id="s{repeat}-{s_id}">')
+                    for word in text.split():
+                        word_id += 1
+                        out.write(f'<w id="w{word_id}">{escape(word)}</w> ')
+                    out.write('</s>\n')
+            out.write('</text>\n')
+
+    pdf_path = os.path.join(sample_dir, "sample.pdf")
+    if not os.path.exists(pdf_path):
+        try:
+            import fitz
+        except ImportError:
+            print("PyMuPDF is not installed; no sample PDF")
+        else:
+            doc = fitz.open()
+            for start in range(0, len(texts), PDF_SENTENCES_PER_PAGE):
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(50, 50, 545, 792), " ".join(texts[start:start + PDF_SENTENCES_PER_PAGE]),
+                                    fontsize=9)
+            doc.save(pdf_path)
+            doc.close()
+    return {"jsonl": jsonl_path, "texts": texts_path, "xml": xml_path,
+            "pdf": pdf_path if os.path.exists(pdf_path) else None}
+
+def read_texts(texts_path):
+    with open(texts_path, 'r', encoding='utf-8') as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+# ---------- Measurements ----------
+
+def metric(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+def best_time(function, repeat):
+    """Fastest of `repeat` calls, in seconds, and the last call's result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def _bench_model(model_path, texts, batch_sizes, n_processes, repeat):
+    """Runs in a fresh spawned process: load time, words/s per setting, peak RSS"""
+    from ner_inference import load_ner_pipeline
+
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+    nlp = load_ner_pipeline(model_path)
+    results = {"load_s": metric(time.perf_counter() - start, "s", False)}
+    for _ in nlp.pipe(texts[:100]):  # warm-up
+        pass
+    words = sum(len(doc) for doc in nlp.tokenizer.pipe(texts))
+    for n_process in n_processes:
+        for batch_size in batch_sizes:
+            seconds, _ = best_time(lambda: sum(1 for _ in nlp.pipe(texts, batch_size=batch_size,
+                                                                   n_process=n_process)), repeat)
+            results[f"words_per_s[batch={batch_size},n_process={n_process}]"] = metric(words / seconds, "words/s")
+    # Children started for n_process > 1 are not included. The process is fresh,
+    # so its peak RSS covers only this pipeline; the growth is current RSS held
+    # by the loaded pipeline after the runs.
+    results["peak_rss_mb"] = metric(peak_rss_mb(), "MB", False)
+    results["rss_growth_mb"] = metric(rss_mb() - baseline_rss, "MB", False)
+    return results
+
+def bench_models(model_paths, texts, batch_sizes=(64, 256, 1000), n_processes=(1,), repeat=3):
+    """nlp.pipe throughput, load time and peak RSS of every pipeline, each in its own process"""
+    from ner_inference import model_names
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    # Unique names, so model-best and model-last of one model get separate history keys
+    for model_path, name in zip(model_paths, model_names(model_paths)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            scores = pool.submit(_bench_model, model_path, texts, list(batch_sizes),
+                                 list(n_processes), repeat).result()
+        results.update({f"{name}/{key}": value for key, value in scores.items()})
+        print(f"  {name}: loaded in {scores['load_s']['value']:.2f}s, "
+              f"peak RSS {scores['peak_rss_mb']['value']:.0f} MB")
+    return results
+
+def bench_text(texts, repeat=3):
+    """clean_text and process_sentences on the sample texts joined into page-sized chunks"""
+    from OCR_sentence_segmentation import clean_text, process_sentences
+
+    pages = ["\n".join(texts[i:i + PDF_SENTENCES_PER_PAGE]) for i in range(0, len(texts), PDF_SENTENCES_PER_PAGE)]
+    chars = sum(len(page) for page in pages)
+    seconds, _ = best_time(lambda: [clean_text(page) for page in pages], repeat)
+    results = {"clean_text/chars_per_s": metric(chars / seconds, "chars/s")}
+    seconds, sentences = best_time(lambda: [process_sentences(page) for page in pages], repeat)
+    results["process_sentences/chars_per_s"] = metric(chars / seconds, "chars/s")
+    results["process_sentences/sentences_per_s"] = metric(sum(map(len, sentences)) / seconds, "sentences/s")
+    return results
+
+def bench_xml(samples, repeat=3):
+    """jsonl_to_xml on the sample JSONL and load_text_xml on the sample _en.xml"""
+    from convert_jsonl_to_xml import jsonl_to_xml
+    from xml_loader import load_text_xml
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = os.path.join(tmp, "sample.xml")
+        seconds, records = best_time(lambda: jsonl_to_xml(samples["jsonl"], xml_path), repeat)
+    results = {"jsonl_to_xml/records_per_s": metric(records / seconds, "records/s")}
+    seconds, (words, _) = best_time(lambda: load_text_xml(samples["xml"]), repeat)
+    results["load_text_xml/words_per_s"] = metric(len(words) / seconds, "words/s")
+    results["load_text_xml/s"] = metric(seconds, "s", False)
+    return results
+
+def bench_pdf(samples, repeat=3):
+    """Text-layer extraction and sentence splitting of the sample PDF (no OCR, no cache)"""
+    from OCR_sentence_segmentation import iter_pdf_pages, iter_sentences, _page_chunks, _new_text_stats
+
+    def extract():
+        pages = iter_pdf_pages(samples["pdf"], workers=1)
+        return sum(1 for _ in iter_sentences(_page_chunks(pages, _new_text_stats())))
+
+    import fitz
+    with fitz.open(samples["pdf"]) as doc:
+        page_count = doc.page_count
+    seconds, sentences = best_time(extract, repeat)
+    return {"pdf_extract/pages_per_s": metric(page_count / seconds, "pages/s"),
+            "pdf_extract/sentences_per_s": metric(sentences / seconds, "sentences/s")}
+
+# ---------- History ----------
+
+def environment():
+    """Where and on what code a run was made"""
+    info = {"host": platform.node(), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    try:
+        import spacy
+        info["spacy"] = spacy.__version__
+    except ImportError:
+        pass
+    try:
+        info["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                                        capture_output=True, text=True, check=True).stdout.strip()
+        info["dirty"] = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "Scripts"],
+                                       cwd=PROJECT_DIR).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        info["commit"] = None
+    return info
+
+def load_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def append_history(history_path, run):
+    history = load_history(history_path)
+    history.append(run)
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    with open(history_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    os.replace(history_path + ".tmp", history_path)
+    return len(history) - 1
+
+def run_benchmarks(model_paths, history_path=DEFAULT_HISTORY, sample_dir=DEFAULT_SAMPLES,
+                   benchmarks=BENCHMARKS, batch_sizes=(64, 256, 1000), n_processes=(1,), repeat=3, label=None):
+    """Run the selected benchmarks and append one entry to the history file"""
+    samples = build_samples(sample_dir)
+    texts = read_texts(samples["texts"])
+    results = {}
+    stages = {
+        "models": lambda: bench_models(model_paths, texts, batch_sizes, n_processes, repeat),
+        "text": lambda: bench_text(texts, repeat),
+        "xml": lambda: bench_xml(samples, repeat),
+        "pdf": lambda: bench_pdf(samples, repeat),
+    }
+    for name in benchmarks:
+        if name == "pdf" and not samples["pdf"]:
+            print("Skipping pdf: no sample PDF")
+            continue
+        print(f"Running {name} benchmarks...")
+        start = time.time()
+        try:
+            results.update(stages[name]())
+        except (ImportError, LookupError) as e:
+            # LookupError: NLTK punkt data not downloaded
+            message = next((line.strip() for line in str(e).splitlines() if line.strip(" *")), "")
+            print(f"Skipping {name}: {message}")
+            continue
+        print(f"  done in {time.time() - start:.1f}s")
+
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "label": label,
+           "environment": environment(), "settings": {"repeat": repeat, "samples": len(texts)},
+           "results": results}
+    index = append_history(history_path, run)
+    for key, result in results.items():
+        print(f"{key:55}{result['value']:>14.2f} {result['unit']}")
+    print(f"Saved run #{index} to {history_path}")
+    return run
+
+def _select(history, ref):
+    """A run by label / commit prefix (latest match), else by index (negative counts from the end)
+
+    Labels and commits are tried first, so an all-digit label or commit is not read as an index.
+    """
+    for run in reversed(history):
+        commit = run["environment"].get("commit") or ""
+        if run.get("label") == ref or (commit and commit.startswith(ref)):
+            return run
+    try:
+        return history[int(ref)]
+    except ValueError:
+        raise SystemExit(f"No run matches {ref!r}")
+    except IndexError:
+        raise SystemExit(f"No run #{ref}: the history has {len(history)} run(s) "
+                         f"(valid indices {-len(history)} to {len(history) - 1})")
+
+def compare(history_path=DEFAULT_HISTORY, baseline="-2", current="-1", threshold=0.1):
+    """Print every shared metric's change; return the ones worse than threshold (a fraction)"""
+    history = load_history(history_path)
+    if len(history) < 2 and baseline == "-2":
+        raise SystemExit(f"Need at least two runs in {history_path} to compare")
+    old, new = _select(history, baseline), _select(history, current)
+    print(f"baseline: {old['timestamp']} {old['environment'].get('commit')} {old.get('label') or ''}")
+    print(f"current:  {new['timestamp']} {new['environment'].get('commit')} {new.get('label') or ''}")
+    if old["environment"].get("host") != new["environment"].get("host"):
+        print("⚠️ Runs are from different hosts; differences may not be due to the code")
+
+    regressions = []
+    print(f"\n{'metric':55}{'baseline':>14}{'current':>14}{'change':>9}")
+    for key in sorted(set(old["results"]) & set(new["results"])):
+        before, after = old["results"][key], new["results"][key]
+        if not before["value"]:
+            continue
+        change = after["value"] / before["value"] - 1
+        # Positive = better, whichever direction the metric improves in
+        gain = change if after["higher_is_better"] else -change
+        flag = ""
+        if gain < -threshold:
+            flag = "  ❌ regression"
+            regressions.append((key, before["value"], after["value"], change))
+        elif gain > threshold:
+            flag = "  ✅"
+        print(f"{key:55}{before['value']:>14.2f}{after['value']:>14.2f}{change:>+9.1%}{flag}")
+    for key in sorted(set(old["results"]) ^ set(new["results"])):
+        print(f"{key:55} only in {'baseline' if key in old['results'] else 'current'}")
+    print(f"\n{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed benchmarks for the NER models and processing scripts")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Run the benchmarks and append the results to the history")
+    run.add_argument("--models", nargs="*",
+                     default=sorted(glob.glob(os.path.join(PROJECT_DIR, "model_0*", "model-best"))),
+                     help="Pipeline directories (default: model_0*/model-best)")
+    run.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    run.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 256, 1000])
+    run.add_argument("--n-process", type=int, nargs="+", default=[1, 2])
+    run.add_argument("--repeat", type=int, default=3, help="Timings are the best of this many runs")
+    run.add_argument("--samples", default=DEFAULT_SAMPLES, help="Directory of the fixed sample corpora")
+    run.add_argument("--label", default=None, help="Name for this run, usable with compare")
+
+    comparison = subparsers.add_parser("compare", help="Compare two runs and flag regressions")
+    comparison.add_argument("--baseline", default="-2", help="Run index, label or commit (default: previous run)")
+    comparison.add_argument("--current", default="-1", help="Run index, label or commit (default: latest run)")
+    comparison.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown, e.g. 0.1 = 10%%")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_benchmarks(args.models, args.history, args.samples, args.only, args.batch_sizes,
+                       args.n_process, args.repeat, args.label)
+    else:
+        sys.exit(1 if compare(args.history, args.baseline, args.current, args.threshold) else 0)
@@ -0,0 +1,163 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter, defaultdict
+from annotation_records import iter_tasks
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, "evaluation", "consistency.jsonl")
+
+def entity_key(words):
+    """Normalized entity text: tokens joined by single spaces, case-folded"""
+    return " ".join(words).casefold()
+
+def span_words(task, span):
+    """Token texts covered by a span (falls back to splitting the span's text)"""
+    if task.tokens and span.token_start is not None and span.token_end is not None:
+        return [token.text for token in task.tokens[span.token_start:span.token_end + 1]]
+    return task.text[span.start:span.end].split()
+
+def _example(dataset, task, **extra):
+    return {"dataset": dataset, "input_hash": task.input_hash, "sentence": task.text, **extra}
+
+def iter_accepted(jsonl_paths):
+    """(dataset name, Task) for every accepted record, file by file"""
+    for jsonl_path in jsonl_paths:
+        dataset = os.path.splitext(os.path.basename(jsonl_path))[0]
+        for task in iter_tasks(jsonl_path):
+            if task.answer == "accept":
+                yield dataset, task
+
+def build_label_index(jsonl_paths, max_examples=5):
+    """One streaming pass: entity text -> label counts, plus sentence-level disagreements
+
+    Returns (labels, examples, max_words, sentence_conflicts):
+      labels: {entity key: Counter(label)}
+      examples: {(entity key, label): [a few occurrences]}
+      max_words: longest labeled entity in tokens (bounds the missing-span scan)
+      sentence_conflicts: the same sentence text annotated differently in two records
+    """
+    labels = defaultdict(Counter)
+    examples = defaultdict(list)
+    max_words = 0
+    first_seen = {}  # sentence digest -> (dataset, input_hash, spans)
+    sentence_conflicts = []
+
+    for dataset, task in iter_accepted(jsonl_paths):
+        annotated = []
+        for span in task.spans:
+            words = span_words(task, span)
+            key = entity_key(words)
+            labels[key][span.label] += 1
+            max_words = max(max_words, len(words))
+            if len(examples[key, span.label]) < max_examples:
+                examples[key, span.label].append(_example(dataset, task, label=span.label))
+            annotated.append((span.start, span.end, span.label))
+
+        digest = hashlib.blake2b(" ".join(task.text.split()).encode('utf-8'), digest_size=12).digest()
+        spans = tuple(sorted(annotated))
+        seen = first_seen.setdefault(digest, (dataset, task.input_hash, spans))
+        if seen[2] != spans:
+            sentence_conflicts.append({
+                "type": "sentence", "sentence": task.text,
+                "first": {"dataset": seen[0], "input_hash": seen[1], "spans": [list(s) for s in seen[2]]},
+                "other": {"dataset": dataset, "input_hash": task.input_hash, "spans": [list(s) for s in spans]},
+            })
+    return labels, examples, max_words, sentence_conflicts
+
+def find_label_conflicts(labels, examples, min_count=1):
+    """Entity texts that received more than one label, most frequent first"""
+    conflicts = []
+    for key, counts in labels.items():
+        if len(counts) > 1 and sum(counts.values()) >= min_count:
+            conflicts.append({
+                "type": "conflict", "text": key, "labels": dict(counts.most_common()),
+                "examples": {label: examples[key, label] for label in counts},
+            })
+    conflicts.sort(key=lambda c: -sum(c["labels"].values()))
+    return conflicts
+
+def find_missing_spans(jsonl_paths, labels, max_words, min_count=2, min_agreement=0.8):
+    """Second pass: unlabeled token sequences whose text is labeled elsewhere
+
+    Only entity texts labeled at least min_count times, with one label holding
+    at least min_agreement of them, are looked for. An occurrence counts as
+    missing when none of its tokens is inside a span and its surface form has
+    an uppercase letter or digit (so "may" is not flagged for "May").
+    """
+    expected = {}
+    for key, counts in labels.items():
+        label, count = counts.most_common(1)[0]
+        total = sum(counts.values())
+        if total >= min_count and count / total >= min_agreement:
+            expected[key] = (label, total)
+
+    missing = []
+    for dataset, task in iter_accepted(jsonl_paths):
+        if not task.tokens:
+            continue
+        words = [token.text for token in task.tokens]
+        covered = [False] * len(words)
+        for span in task.spans:
+            if span.token_start is not None and span.token_end is not None:
+                covered[span.token_start:span.token_end + 1] = [True] * (span.token_end - span.token_start + 1)
+        folded = [word.casefold() for word in words]
+        for start in range(len(words)):
+            if covered[start]:
+                continue
+            for end in range(start + 1, min(start + max_words, len(words)) + 1):
+                if covered[end - 1]:
+                    break
+                key = " ".join(folded[start:end])
+                if key in expected:
+                    surface = " ".join(words[start:end])
+                    if any(ch.isupper() or ch.isdigit() for ch in surface):
+                        label, total = expected[key]
+                        missing.append(dict(_example(dataset, task), type="missing", text=surface,
+                                            expected_label=label, labeled_elsewhere=total,
+                                            token_start=start, token_end=end - 1))
+    return missing
+
+def check(jsonl_paths, output_path, min_count=2, min_agreement=0.8, max_examples=5):
+    start = time.time()
+    labels, examples, max_words, sentence_conflicts = build_label_index(jsonl_paths, max_examples)
+    conflicts = find_label_conflicts(labels, examples)
+    missing = find_missing_spans(jsonl_paths, labels, max_words, min_count, min_agreement)
+    elapsed = time.time() - start
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for issue in conflicts + sentence_conflicts + missing:
+            out.write(json.dumps(issue, ensure_ascii=False) + "\n")
+
+    print(f"Indexed {len(labels)} entity texts from {len(jsonl_paths)} files in {elapsed:.2f}s")
+    print(f"  {len(conflicts)} texts with conflicting labels")
+    print(f"  {len(sentence_conflicts)} sentences annotated differently across records")
+    print(f"  {len(missing)} possibly missing spans")
+    for conflict in conflicts[:15]:
+        distribution = ", ".join(f"{label} {count}" for label, count in conflict["labels"].items())
+        print(f"  {conflict['text']!r}: {distribution}")
+    print(f"Report written to {output_path}")
+    return conflicts, sentence_conflicts, missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find label conflicts and missing spans across the checked annotations")
+    parser.add_argument("files", nargs="*", help="JSONL files (default: Checked_Annotations/*.jsonl)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSONL report of all issues")
+    parser.add_argument("--min-count", type=int, default=2,
+                        help="Times a text must be labeled before unlabeled occurrences are flagged")
+    parser.add_argument("--min-agreement", type=float, default=0.8,
+                        help="Share of the majority label required before flagging missing spans")
+    parser.add_argument("--max-examples", type=int, default=5, help="Examples kept per text and label")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(DEFAULT_ANNOTATIONS, "*.jsonl")))
+    conflicts, _, missing = check(files, args.output, args.min_count, args.min_agreement, args.max_examples)
+    sys.exit(1 if conflicts or missing else 0)
@@ -1,18 +1,20 @@
+import io
 import os
 import re
+import argparse
 from lxml import etree
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from xml_loader import load_text_xml
 
 INPUT_DIR = "/Users/liuxduan/Desktop/Prodigy/Cleaned_Alpine_Journal"
 OUTPUT_FILE = os.path.join(INPUT_DIR, "prodigy_annotated.txt")
 
-def load_word_mapping(text_xml):
+PUNCT_SPACING = re.compile(r'\s([,.!?])')
+
+def load_word_mapping(words):
     """创建单词ID到文本的映射"""
-    tree = etree.parse(text_xml)
-    return {
-        word.get('id'): word.text 
-        for word in tree.xpath('//w')
-    }
+    return {wid: text for wid, (text, _) in words.items()}
 
 def extract_entities(ner_xml, word_map):
     """提取实体及其位置"""
@@ -43,24 +45,24 @@ def extract_entities(ner_xml, word_map):
     
     return entities
 
-def reconstruct_text(text_xml):
+def reconstruct_text(sentences):
     """重建原始文本"""
-    tree = etree.parse(text_xml)
-    sentences = []
+    reconstructed = []
     
-    for s in tree.xpath('//s'):
-        sentence = ' '.join(w.text for w in s.xpath('./w'))
+    for _, words in sentences:
+        sentence = ' '.join(words)
         # 简单的标点规范化
-        sentence = re.sub(r'\s([,.!?])', r'\1', sentence)
-        sentences.append(sentence)
+        sentence = PUNCT_SPACING.sub(r'\1', sentence)
+        reconstructed.append(sentence)
     
-    return ' '.join(sentences)
+    return ' '.join(reconstructed)
 
 def process_file_pair(text_file, ner_file, output_handle):
     """处理单个文件对"""
-    # 加载数据
-    word_map = load_word_mapping(text_file)
-    text = reconstruct_text(text_file)
+    # 加载数据（文本XML只解析一遍）
+    words, sentences = load_text_xml(text_file)
+    word_map = load_word_mapping(words)
+    text = reconstruct_text(sentences)
     entities = extract_entities(ner_file, word_map)
     
     # 写入输出
@@ -76,27 +78,51 @@ def process_file_pair(text_file, ner_file, output_handle):
     
     output_handle.write("="*50 + "\n\n")
 
-def batch_process():
-    """批量处理所有文件"""
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as outfile:
-        for filename in os.listdir(INPUT_DIR):
-            if filename.endswith('_en.xml'):
-                ner_file = filename.replace('_en.xml', '_en-ner.xml')
-                ner_path = os.path.join(INPUT_DIR, ner_file)
-                
-                if os.path.exists(ner_path):
-                    try:
-                        process_file_pair(
-                            os.path.join(INPUT_DIR, filename),
-                            ner_path,
-                            outfile
-                        )
-                        print(f"Processed: {filename}")
-                    except Exception as e:
-                        print(f"Error processing {filename}: {str(e)}")
-                else:
-                    print(f"Skipping {filename}: No matching NER file")
+def render_file_pair(text_file, ner_file):
+    """在工作进程中处理一个文件对，返回 (输出文本, 错误信息或None)"""
+    output = io.StringIO()
+    try:
+        process_file_pair(text_file, ner_file, output)
+    except Exception as e:
+        return '', str(e)
+    return output.getvalue(), None
+
+def batch_process(workers=None, input_dir=INPUT_DIR, output_file=None):
+    """批量处理所有文件（多进程并行，按文件名顺序写出）
+
+    output_file 默认为 input_dir 下的 prodigy_annotated.txt。
+    """
+    output_file = output_file or os.path.join(input_dir, os.path.basename(OUTPUT_FILE))
+    text_files = []
+    ner_files = []
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith('_en.xml'):
+            ner_file = filename.replace('_en.xml', '_en-ner.xml')
+            ner_path = os.path.join(input_dir, ner_file)
+            
+            if os.path.exists(ner_path):
+                text_files.append(os.path.join(input_dir, filename))
+                ner_files.append(ner_path)
+            else:
+                print(f"Skipping {filename}: No matching NER file")
+
+    with open(output_file, 'w', encoding='utf-8') as outfile, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(render_file_pair, text_files, ner_files)
+        for text_file, (output, error) in zip(text_files, results):
+            filename = os.path.basename(text_file)
+            if error is not None:
+                print(f"Error processing {filename}: {error}")
+                continue
+            outfile.write(output)
+            print(f"Processed: {filename}")
+    return output_file
 
 if __name__ == "__main__":
-    batch_process()
-    print(f"\nAnnotation complete. Output saved to:\n{OUTPUT_FILE}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="合并文本XML与NER XML，输出带实体的文本")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数（默认每个CPU一个）")
+    parser.add_argument("--input-dir", default=INPUT_DIR, help="_en.xml / _en-ner.xml 文件所在文件夹")
+    parser.add_argument("--output", default=None, help="输出文件（默认：输入文件夹下的 prodigy_annotated.txt）")
+    args = parser.parse_args()
+    output_file = batch_process(args.workers, args.input_dir, args.output)
+    print(f"\nAnnotation complete. Output saved to:\n{output_file}")
@@ -1,81 +1,119 @@
-import json
-import xml.etree.ElementTree as ET
+import os
+import argparse
 from pathlib import Path
-from xml.dom import minidom
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from annotation_records import iter_tasks
 
-def prettify(elem):
-    """Return a pretty-printed XML string for the Element."""
-    rough_string = ET.tostring(elem, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+def _escape_text(text):
+    # Line ends are normalized to \n, as in the checked-in XML files
+    text = str(text).replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _escape_attr(value):
+    value = str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return value.replace("\"", "&quot;").replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#9;")
+
+def _element(tag, text=None, attrs=(), indent=""):
+    """One indented element line: <tag a="1">text</tag> or <tag a="1"/>"""
+    attr_str = "".join(f' {name}="{_escape_attr(value)}"' for name, value in attrs)
+    if text:
+        return f"{indent}<{tag}{attr_str}>{_escape_text(text)}</{tag}>\n"
+    return f"{indent}<{tag}{attr_str}/>\n"
+
+def _str(value):
+    return "" if value is None else str(value)
+
+def annotation_to_xml(task, indent="  "):
+    """Serialize one Task as an indented <annotation> block"""
+    level1, level2 = indent * 2, indent * 3
+    parts = [f"{indent}<annotation>\n",
+             _element("text", task.text, indent=level1),
+             _element("answer", task.answer, indent=level1)]
+
+    # Add tokens if they exist
+    if task.tokens is not None:
+        if task.tokens:
+            parts.append(f"{level1}<tokens>\n")
+            for token in task.tokens:
+                attrs = [("id", _str(token.id)), ("start", token.start), ("end", token.end)]
+                parts.append(_element("token", token.text, attrs, level2))
+            parts.append(f"{level1}</tokens>\n")
+        else:
+            parts.append(f"{level1}<tokens/>\n")
+
+    # Add spans if they exist
+    if task.spans:
+        parts.append(f"{level1}<spans>\n")
+        for span in task.spans:
+            attrs = [("start", span.start), ("end", span.end), ("label", span.label)]
+            # Add token references if available
+            if span.token_start is not None and span.token_end is not None:
+                attrs += [("token_start", span.token_start), ("token_end", span.token_end)]
+            parts.append(_element("span", span.text, attrs, level2))
+        parts.append(f"{level1}</spans>\n")
+
+    # Add metadata
+    parts += [f"{level1}<metadata>\n",
+              _element("input_hash", _str(task.input_hash), indent=level2),
+              _element("task_hash", _str(task.task_hash), indent=level2),
+              _element("timestamp", _str(task.timestamp), indent=level2),
+              _element("view_id", task.view_id, indent=level2),
+              f"{level1}</metadata>\n",
+              f"{indent}</annotation>\n"]
+    return "".join(parts)
 
 def jsonl_to_xml(jsonl_path, xml_path):
-    # Create root element
-    root = ET.Element("annotations")
-    
-    # Read JSONL file
-    with open(jsonl_path, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            try:
-                data = json.loads(line.strip())
-                # Create annotation element for each record
-                annotation = ET.SubElement(root, "annotation")
-                
-                # Add basic fields
-                ET.SubElement(annotation, "text").text = data.get("text", "")
-                ET.SubElement(annotation, "answer").text = data.get("answer", "")
-                
-                # Add tokens if they exist
-                if "tokens" in data:
-                    tokens_elem = ET.SubElement(annotation, "tokens")
-                    for token in data["tokens"]:
-                        token_elem = ET.SubElement(tokens_elem, "token")
-                        token_elem.set("id", str(token.get("id", "")))
-                        token_elem.set("start", str(token.get("start", "")))
-                        token_elem.set("end", str(token.get("end", "")))
-                        token_elem.text = token.get("text", "")
-                
-                # Add spans if they exist
-                if "spans" in data and data["spans"]:
-                    spans_elem = ET.SubElement(annotation, "spans")
-                    for span in data["spans"]:
-                        span_elem = ET.SubElement(spans_elem, "span")
-                        span_elem.set("start", str(span.get("start", "")))
-                        span_elem.set("end", str(span.get("end", "")))
-                        span_elem.set("label", span.get("label", ""))
-                        span_elem.text = span.get("text", "")
-                        
-                        # Add token references if available
-                        if "token_start" in span and "token_end" in span:
-                            span_elem.set("token_start", str(span["token_start"]))
-                            span_elem.set("token_end", str(span["token_end"]))
-                
-                # Add metadata
-                meta_elem = ET.SubElement(annotation, "metadata")
-                ET.SubElement(meta_elem, "input_hash").text = str(data.get("_input_hash", ""))
-                ET.SubElement(meta_elem, "task_hash").text = str(data.get("_task_hash", ""))
-                ET.SubElement(meta_elem, "timestamp").text = str(data.get("_timestamp", ""))
-                ET.SubElement(meta_elem, "view_id").text = data.get("_view_id", "")
-                        
-            except json.JSONDecodeError as e:
-                print(f"Error parsing line {line_num} in {jsonl_path}: {e}")
-    
-    # Write prettified XML to file
-    with open(xml_path, 'w', encoding='utf-8') as f:
-        f.write(prettify(root))
+    """Stream a Prodigy JSONL export into XML, one <annotation> per line
+
+    Each record is written as soon as it is parsed, so memory stays constant
+    regardless of file size. The output matches the checked-in XML files:
+    two-space indentation, one element per line, empty elements as <tag/>.
+    Lines that fail validation are skipped, and their count is printed.
+    """
+    count = 0
+    stats = {}
+    with open(xml_path, 'w', encoding='utf-8', buffering=1024 * 1024) as out:
+        out.write('<?xml version="1.0" ?>\n')
+        for task in iter_tasks(jsonl_path, stats):
+            if count == 0:
+                out.write("<annotations>\n")
+            out.write(annotation_to_xml(task))
+            count += 1
+        out.write("</annotations>\n" if count else "<annotations/>\n")
+    if stats["skipped"]:
+        print(f"Skipped {stats['skipped']} invalid line(s) in {jsonl_path}")
+    return count
+
+def _convert_file(jsonl_file, xml_file):
+    print(f"Converting {jsonl_file} to {xml_file}")
+    return jsonl_to_xml(jsonl_file, xml_file)
+
+def convert_directory(input_dir, files_to_convert, workers=None, output_dir=None):
+    """Convert the listed JSONL files to XML, several files at a time
 
-def convert_directory(input_dir, files_to_convert):
+    The XML files are written to output_dir (default: alongside the JSONL files).
+    """
     input_path = Path(input_dir)
-    
+    output_path = Path(output_dir) if output_dir else input_path
+    output_path.mkdir(parents=True, exist_ok=True)
+    jobs = []
     for filename in files_to_convert:
         jsonl_file = input_path / filename
         if jsonl_file.exists():
-            xml_filename = jsonl_file.stem + '.xml'
-            xml_file = input_path / xml_filename
-            print(f"Converting {jsonl_file} to {xml_file}")
-            jsonl_to_xml(jsonl_file, xml_file)
+            jobs.append((jsonl_file, output_path / (jsonl_file.stem + '.xml')))
         else:
             print(f"File not found: {jsonl_file}")
+    if not jobs:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+        futures = {pool.submit(_convert_file, jsonl_file, xml_file): jsonl_file
+                   for jsonl_file, xml_file in jobs}
+        for future in as_completed(futures):
+            try:
+                print(f"Wrote {future.result()} annotations from {futures[future].name}")
+            except Exception as e:
+                print(f"Error converting {futures[future]}: {e}")
 
 if __name__ == "__main__":
     input_dir = "/Users/liuxduan/Desktop/Prodigy/Checked_Annotations"
@@ -87,5 +125,13 @@ if __name__ == "__main__":
         "annotations_2301_Latest.jsonl"
     ]
     
-    convert_directory(input_dir, files_to_convert)
+    parser = argparse.ArgumentParser(description="Convert Prodigy JSONL exports to XML")
+    parser.add_argument("files", nargs="*", default=files_to_convert,
+                        help="JSONL files, relative to --input-dir (default: the checked annotation exports)")
+    parser.add_argument("--input-dir", default=input_dir)
+    parser.add_argument("--output-dir", default=None, help="Where to write the XML (default: --input-dir)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    
+    convert_directory(args.input_dir, args.files, args.workers, args.output_dir)
     print("Conversion complete!")
\ No newline at end of file
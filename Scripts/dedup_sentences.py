@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import tempfile
+from array import array
+import numpy as np
+
+# MinHash/LSH 默认参数：64 个哈希分成 8 段、每段 8 行，
+# 估计相似度约 0.77 以上的句子对才有较大概率落入同一个桶
+NUM_PERM = 64
+BANDS = 8
+SHINGLE_SIZE = 5
+THRESHOLD = 0.8
+BATCH_SIZE = 20000
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(sentence):
+    """近似去重用的规范化：小写，非字母数字字符压缩成一个空格"""
+    return _NON_WORD.sub(' ', sentence.lower()).strip()
+
+def exact_hash(sentence):
+    """句子原文的 64 位哈希"""
+    return int.from_bytes(hashlib.blake2b(sentence.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def scan_lines(input_path):
+    """第一遍：每个非空行的字节偏移、文件行号（从 1 开始）和精确哈希（每句 24 字节）"""
+    offsets = array('q')
+    line_numbers = array('q')
+    hashes = array('Q')
+    with open(input_path, 'rb') as f:
+        position = 0
+        for line_number, raw in enumerate(f, 1):
+            sentence = raw.decode('utf-8').strip()
+            if sentence:
+                offsets.append(position)
+                line_numbers.append(line_number)
+                hashes.append(exact_hash(sentence))
+            position += len(raw)
+    return (np.frombuffer(offsets, dtype=np.int64), np.frombuffer(line_numbers, dtype=np.int64),
+            np.frombuffer(hashes, dtype=np.uint64))
+
+def iter_sentences(input_path):
+    """按顺序产出 (序号, 句子)，序号与 scan_lines 一致"""
+    with open(input_path, 'rb') as f:
+        index = 0
+        for raw in f:
+            sentence = raw.decode('utf-8').strip()
+            if sentence:
+                yield index, sentence
+                index += 1
+
+def read_sentence(f, offset):
+    f.seek(int(offset))
+    return f.readline().decode('utf-8').strip()
+
+def permutations(num_perm, seed=1):
+    """MinHash 用的 multiply-shift 哈希参数 (a, c)，a 为奇数"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    c = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a, c
+
+def minhash_batch(sentences, a, c, shingle_size=SHINGLE_SIZE):
+    """一批句子的 MinHash 签名，形状 (句子数, num_perm)，字节级 shingle"""
+    encoded = [normalize(s).encode('utf-8').ljust(shingle_size, b'\0') for s in sentences]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    # 整批一起计算滚动哈希，再只取不跨句子边界的位置
+    rolling = np.zeros(len(data) - shingle_size + 1, dtype=np.uint64)
+    for i in range(shingle_size):
+        rolling = rolling * np.uint64(1099511628211) + data[i:len(data) - shingle_size + 1 + i]
+    counts = lengths - shingle_size + 1
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    segments = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.repeat(starts - segments, counts) + np.arange(counts.sum())
+    shingles = rolling[positions]
+
+    signatures = np.empty((len(sentences), len(a)), dtype=np.uint32)
+    for j in range(len(a)):
+        permuted = (shingles * a[j] + c[j]) >> np.uint64(32)
+        signatures[:, j] = np.minimum.reduceat(permuted, segments)
+    return signatures
+
+def find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+def flatten(parent):
+    """把并查集的每个节点直接指向根（合并时总是指向较小的序号）"""
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+def lsh_clusters(signatures, bands, threshold, chunk=1 << 20):
+    """LSH 分段找候选对，按签名估计的相似度确认后合并，返回每行的簇代表（最小序号）
+
+    每段的桶用排序后的键数组表示，桶内只比较相邻成员，
+    因此内存和比较次数都与句子数成线性，不会因大桶而爆炸。
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = np.arange(n, dtype=np.int64)
+    if n < 2:
+        return parent
+
+    for band in range(bands):
+        keys = np.empty(n, dtype=np.uint64)
+        for start in range(0, n, chunk):
+            block = np.asarray(signatures[start:start + chunk, band * rows:(band + 1) * rows], dtype=np.uint64)
+            key = np.zeros(len(block), dtype=np.uint64)
+            for column in range(rows):
+                key = (key ^ block[:, column]) * np.uint64(0x100000001B3)
+            keys[start:start + chunk] = key
+        order = np.argsort(keys, kind='stable')
+        same = keys[order[1:]] == keys[order[:-1]]
+        left, right = order[:-1][same], order[1:][same]
+
+        for start in range(0, len(left), chunk):
+            a, b = left[start:start + chunk], right[start:start + chunk]
+            similarity = (np.asarray(signatures[a]) == np.asarray(signatures[b])).mean(axis=1)
+            for i, j in zip(a[similarity >= threshold].tolist(), b[similarity >= threshold].tolist()):
+                root_i, root_j = find(parent, i), find(parent, j)
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return flatten(parent)
+
+def dedup(input_path, output_path, report_path, threshold=THRESHOLD, num_perm=NUM_PERM,
+          bands=BANDS, shingle_size=SHINGLE_SIZE, batch_size=BATCH_SIZE, work_dir=None):
+    """去掉完全重复和近似重复的句子，保留每簇第一次出现的句子，并写出被删除的簇"""
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) 必须能被 bands ({bands}) 整除")
+
+    # 1. 精确去重：相同哈希的行归到第一次出现的行
+    offsets, line_numbers, hashes = scan_lines(input_path)
+    n = len(offsets)
+    _, first_index, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    exact_root = first_index[inverse.reshape(-1)]
+    unique_lines = np.sort(first_index)
+    print(f"📄 共 {n} 句，完全重复 {n - len(unique_lines)} 句")
+
+    # 2. 只为不重复的句子计算 MinHash 签名，签名存放在磁盘上的 memmap 中
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        signatures = np.lib.format.open_memmap(
+            os.path.join(tmp, 'signatures.npy'), mode='w+', dtype=np.uint32,
+            shape=(len(unique_lines), num_perm))
+        a, c = permutations(num_perm)
+        is_unique = np.zeros(n, dtype=bool)
+        is_unique[unique_lines] = True
+        batch = []
+        row = 0
+        for index, sentence in iter_sentences(input_path):
+            if is_unique[index]:
+                batch.append(sentence)
+                if len(batch) == batch_size:
+                    signatures[row:row + len(batch)] = minhash_batch(batch, a, c, shingle_size)
+                    row += len(batch)
+                    batch = []
+        if batch:
+            signatures[row:row + len(batch)] = minhash_batch(batch, a, c, shingle_size)
+
+        # 3. LSH 找近似重复，簇代表映射回行号
+        near_root = unique_lines[lsh_clusters(signatures, bands, threshold)]
+        root = np.empty(n, dtype=np.int64)
+        root[unique_lines] = near_root
+        root = root[exact_root]
+
+        # 4. 写出保留的句子和被删除的簇
+        kept = 0
+        with open(output_path, 'w', encoding='utf-8', buffering=8 * 1024 * 1024) as out:
+            for index, sentence in iter_sentences(input_path):
+                if root[index] == index:
+                    out.write(sentence + '\n')
+                    kept += 1
+
+        row_of_line = np.full(n, -1, dtype=np.int64)
+        row_of_line[unique_lines] = np.arange(len(unique_lines))
+        dropped = np.flatnonzero(root != np.arange(n))
+        dropped = dropped[np.argsort(root[dropped], kind='stable')]
+        clusters = 0
+        with open(input_path, 'rb') as f, open(report_path, 'w', encoding='utf-8') as report:
+            for members in np.split(dropped, np.flatnonzero(np.diff(root[dropped])) + 1):
+                if not len(members):
+                    continue
+                kept_line = int(root[members[0]])
+                entries = []
+                for line in members.tolist():
+                    if exact_root[line] == kept_line:
+                        reason, similarity = 'exact', 1.0
+                    else:
+                        reason = 'near'
+                        similarity = float((signatures[row_of_line[exact_root[line]]] ==
+                                            signatures[row_of_line[kept_line]]).mean())
+                    entries.append({"line": int(line_numbers[line]), "text": read_sentence(f, offsets[line]),
+                                    "reason": reason, "similarity": round(similarity, 3)})
+                report.write(json.dumps({"kept_line": int(line_numbers[kept_line]),
+                                         "kept": read_sentence(f, offsets[kept_line]),
+                                         "dropped": entries}, ensure_ascii=False) + '\n')
+                clusters += 1
+
+    print(f"✅ 保留 {kept} 句，删除 {n - kept} 句（{clusters} 个簇）")
+    print(f"📝 输出文件: {output_path}")
+    print(f"📊 删除报告: {report_path}")
+    return kept, n - kept
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="标注前去掉完全重复和近似重复的句子（MinHash/LSH）")
+    parser.add_argument("input", help="merge_txt.py 简单模式的输出（每行一句）")
+    parser.add_argument("output", help="去重后的句子文件")
+    parser.add_argument("--report", default=None, help="被删除句子簇的JSONL报告（默认：输出文件名.clusters.jsonl）")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="近似重复的相似度阈值")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM, help="MinHash 哈希个数")
+    parser.add_argument("--bands", type=int, default=BANDS, help="LSH 分段数")
+    parser.add_argument("--shingle-size", type=int, default=SHINGLE_SIZE, help="字符 shingle 长度")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批计算签名的句子数")
+    parser.add_argument("--work-dir", default=None, help="存放签名临时文件的目录")
+    args = parser.parse_args()
+
+    report_path = args.report or os.path.splitext(args.output)[0] + '.clusters.jsonl'
+    dedup(args.input, args.output, report_path, args.threshold, args.num_perm,
+          args.bands, args.shingle_size, args.batch_size, args.work_dir)
@@ -0,0 +1,187 @@
+import os
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import spacy
+from spacy.tokens import DocBin, Span
+from spacy.util import load_config
+from ner_inference import load_ner_pipeline, model_name, read_records, doc_to_task
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHUNK_SIZE = 500  # sentences tokenized and sent to the models at a time
+MIN_AGREEMENT = 0.5  # a span is kept when it has more than this share of the vote
+REVIEW_BELOW = 0.8  # sentences less certain than this go to the review file
+
+def model_weight(model_path):
+    """Voting weight of a pipeline: its dev ents_f from meta.json (1.0 if missing)"""
+    try:
+        with open(os.path.join(model_path, "meta.json"), 'r', encoding='utf-8') as f:
+            return float(json.load(f)["performance"]["ents_f"])
+    except (OSError, KeyError, TypeError, ValueError):
+        return 1.0
+
+# ---------- Worker processes (one per model) ----------
+
+_worker_nlp = None
+
+def _init_model(model_path):
+    global _worker_nlp
+    _worker_nlp = load_ner_pipeline(model_path)
+
+def _predict(doc_bytes, batch_size):
+    """(start, end, label) token spans per doc of a serialized, already tokenized chunk"""
+    docs = DocBin().from_bytes(doc_bytes).get_docs(_worker_nlp.vocab)
+    return [[(ent.start, ent.end, ent.label_) for ent in doc.ents]
+            for doc in _worker_nlp.pipe(docs, batch_size=batch_size)]
+
+# ---------- Voting ----------
+
+def vote(predictions, weights, min_agreement=MIN_AGREEMENT):
+    """Merge one sentence's predictions from every model
+
+    predictions: [[(start, end, label), ...] per model], weights: per model.
+    Every distinct span gets agreement = weight of the models that predicted
+    it / total weight. Spans above min_agreement are kept, highest agreement
+    first (longer span on ties), skipping any that overlap a kept span.
+
+    Returns (kept spans [(start, end, label, agreement, [model indices])],
+             certainty = the lowest max(a, 1 - a) over all candidate spans,
+             1.0 when the models agree on every span).
+    """
+    total = sum(weights)
+    votes = {}
+    for index, (spans, weight) in enumerate(zip(predictions, weights)):
+        for span in spans:
+            entry = votes.setdefault(span, [0.0, []])
+            entry[0] += weight
+            entry[1].append(index)
+
+    kept = []
+    taken = set()
+    certainty = 1.0
+    ranked = sorted(votes.items(), key=lambda item: (-item[1][0], item[0][0] - item[0][1], item[0]))
+    for (start, end, label), (weight, voters) in ranked:
+        agreement = weight / total
+        certainty = min(certainty, max(agreement, 1 - agreement))
+        if agreement > min_agreement and not taken.intersection(range(start, end)):
+            taken.update(range(start, end))
+            kept.append((start, end, label, agreement, voters))
+    kept.sort()
+    return kept, certainty
+
+# ---------- Pipeline ----------
+
+def iter_chunks(records, tokenizer, chunk_size=CHUNK_SIZE):
+    """(docs, metas, DocBin bytes) per chunk; every text is tokenized once here"""
+    texts, metas = [], []
+    for text, meta in records:
+        texts.append(text)
+        metas.append(meta)
+        if len(texts) == chunk_size:
+            yield _chunk(texts, metas, tokenizer)
+            texts, metas = [], []
+    if texts:
+        yield _chunk(texts, metas, tokenizer)
+
+def _chunk(texts, metas, tokenizer):
+    docs = list(tokenizer.pipe(texts))
+    doc_bin = DocBin(attrs=["ORTH", "SPACY"])
+    for doc in docs:
+        doc_bin.add(doc)
+    return docs, metas, doc_bin.to_bytes()
+
+def run_ensemble(model_paths, input_path, output_path, review_path, weights=None, min_agreement=MIN_AGREEMENT,
+                 review_below=REVIEW_BELOW, chunk_size=CHUNK_SIZE, batch_size=256):
+    """Run every model in its own process over one shared tokenization and write the voted spans
+
+    Chunks are pipelined: the parent tokenizes chunk n + 1 while the models
+    work on chunk n, and each model process runs independently, so a run
+    takes about as long as the slowest model rather than the sum.
+    """
+    names = [model_name(path) for path in model_paths]
+    weights = list(weights) if weights else [model_weight(path) for path in model_paths]
+    print("Weights: " + ", ".join(f"{name} {weight:.3f}" for name, weight in zip(names, weights)))
+
+    # All model_0x pipelines share the English tokenizer; the first model's is used for everyone
+    components = load_config(os.path.join(model_paths[0], "config.cfg"))["nlp"]["pipeline"]
+    tokenizer = spacy.load(model_paths[0], exclude=components).tokenizer
+    context = multiprocessing.get_context("spawn")
+    pools = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_model, initargs=(path,))
+             for path in model_paths]
+    # Load every model (in parallel) before timing the run
+    empty = DocBin().to_bytes()
+    for future in [pool.submit(_predict, empty, batch_size) for pool in pools]:
+        future.result()
+    print(f"Loaded {len(pools)} models")
+
+    counts = {"sentences": 0, "spans": 0, "review": 0}
+    start = time.time()
+    try:
+        with open(output_path, 'w', encoding='utf-8') as out, open(review_path, 'w', encoding='utf-8') as review:
+            pending = deque()
+            for docs, metas, doc_bytes in iter_chunks(read_records(input_path), tokenizer, chunk_size):
+                pending.append((docs, metas, [pool.submit(_predict, doc_bytes, batch_size) for pool in pools]))
+                if len(pending) >= 2:
+                    _write_chunk(*pending.popleft(), out, review, names, weights, min_agreement, review_below, counts)
+            while pending:
+                _write_chunk(*pending.popleft(), out, review, names, weights, min_agreement, review_below, counts)
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+    elapsed = time.time() - start
+    print(f"Ensembled {counts['sentences']} sentences with {len(model_paths)} models in {elapsed:.1f}s "
+          f"({counts['sentences'] / elapsed if elapsed else 0:.0f} sentences/s)")
+    print(f"  {counts['spans']} spans -> {output_path}")
+    print(f"  {counts['review']} sentences for review -> {review_path}")
+    return counts
+
+def _write_chunk(docs, metas, futures, out, review, names, weights, min_agreement, review_below, counts):
+    per_model = [future.result() for future in futures]
+    for i, (doc, meta) in enumerate(zip(docs, metas)):
+        predictions = [spans[i] for spans in per_model]
+        kept, certainty = vote(predictions, weights, min_agreement)
+        doc.ents = [Span(doc, start, end, label=label) for start, end, label, _, _ in kept]
+        task = doc_to_task(doc, "ensemble", dict(meta, agreement=round(certainty, 3)))
+        for span, (_, _, _, agreement, voters) in zip(task["spans"], kept):
+            span["agreement"] = round(agreement, 3)
+            span["models"] = [names[v] for v in voters]
+        out.write(json.dumps(task, ensure_ascii=False) + "\n")
+        counts["sentences"] += 1
+        counts["spans"] += len(kept)
+        if certainty < review_below:
+            task["meta"]["predictions"] = {name: [{"text": doc[s:e].text, "label": label, "token_start": s,
+                                                   "token_end": e - 1} for s, e, label in spans]
+                                           for name, spans in zip(names, predictions)}
+            review.write(json.dumps(task, ensure_ascii=False) + "\n")
+            counts["review"] += 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weighted-vote ensemble of several model_0x pipelines")
+    parser.add_argument("input", help="Sentence file (one per line) or JSONL with a \"text\" field")
+    parser.add_argument("output", help="Prodigy JSONL with the voted spans and their agreement")
+    parser.add_argument("--review", default=None,
+                        help="JSONL of sentences the models disagree on (default: <output>.review.jsonl)")
+    parser.add_argument("--models", nargs="+",
+                        default=sorted(glob.glob(os.path.join(PROJECT_DIR, "model_0*", "model-best"))),
+                        help="Pipeline directories (default: model_0*/model-best)")
+    parser.add_argument("--weights", type=float, nargs="+", default=None,
+                        help="One weight per model (default: each model's ents_f from meta.json)")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT,
+                        help="Share of the weighted vote a span needs to be kept")
+    parser.add_argument("--review-below", type=float, default=REVIEW_BELOW,
+                        help="Sentences whose least certain span is below this go to review")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.weights and len(args.weights) != len(args.models):
+        parser.error("--weights needs one value per model")
+    review_path = args.review or os.path.splitext(args.output)[0] + ".review.jsonl"
+    run_ensemble(args.models, args.input, args.output, review_path, args.weights, args.min_agreement,
+                 args.review_below, args.chunk_size, args.batch_size)
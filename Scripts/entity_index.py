@@ -0,0 +1,390 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from array import array
+from collections import Counter, defaultdict
+import numpy as np
+from annotation_records import iter_tasks
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INDEX = os.path.join(PROJECT_DIR, "entity_index")
+
+UNKNOWN_YEAR = 0
+# "  Entities: [Eiger|MOUNTAIN], [Chris Bonington|PERSON]" lines of yearly_sentences_annotated.py
+ENTITY_ITEM = re.compile(r'\[(.*?)\|([A-Za-z_]+)\](?=, \[|$)')
+FILENAME_YEAR = re.compile(r'(?<!\d)(1[89]\d\d|20\d\d)(?!\d)')
+
+def normalize(text):
+    """Lookup key of an entity: whitespace collapsed, case-folded"""
+    return " ".join(text.split()).casefold()
+
+# ---------- Posting lists: delta + varint (LEB128) ----------
+
+def encode_postings(ids):
+    """Sorted unique sentence ids -> bytes; 7 bits per byte, high bit set on all but the last"""
+    deltas = np.diff(np.asarray(ids, dtype=np.uint64), prepend=np.uint64(0))
+    if not len(deltas):
+        return b""
+    n_bytes = np.ones(len(deltas), dtype=np.int64)
+    for k in range(1, 10):
+        n_bytes += deltas >= (np.uint64(1) << np.uint64(7 * k))
+    position = np.arange(int(n_bytes.max()))
+    groups = ((deltas[:, None] >> (position.astype(np.uint64) * np.uint64(7))) & np.uint64(0x7f)).astype(np.uint8)
+    groups[position[None, :] < n_bytes[:, None] - 1] |= 0x80
+    return groups[position[None, :] < n_bytes[:, None]].tobytes()
+
+def decode_varints(b):
+    """uint8 array of varints -> int64 array of the values, vectorized"""
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = (np.arange(len(b)) - np.repeat(starts, ends - starts + 1)) * 7
+    return np.add.reduceat((b & 0x7f).astype(np.int64) << shift, starts)
+
+def decode_postings(data):
+    """Inverse of encode_postings"""
+    return np.cumsum(decode_varints(np.frombuffer(data, dtype=np.uint8)))
+
+# ---------- Readers ----------
+
+def iter_yearly_output(path):
+    """(year, sentence, [(entity text, label)]) from a yearly_sentences_annotated.py output file
+
+    Each sentence is written as a blank line, the sentence line and an optional
+    "  Entities:" line, so the line after a blank separator is always a sentence,
+    even when it is empty itself.
+    """
+    year = UNKNOWN_YEAR
+    in_sentences = expect_sentence = False
+    sentence, entities = None, []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith("=== YEAR "):
+                year = int(line[len("=== YEAR "):].strip(" ="))
+            elif line == "=== Sentences ===":
+                in_sentences = True
+            elif line == "=== Entity Index ===":
+                in_sentences = False
+            elif not in_sentences:
+                continue
+            elif expect_sentence:
+                if sentence is not None:
+                    yield sentence_year, sentence, entities
+                sentence, sentence_year, entities = line, year, []
+                expect_sentence = False
+                continue
+            elif not line:
+                expect_sentence = True
+                continue
+            elif line.startswith("  Entities: ") and sentence is not None:
+                entities = ENTITY_ITEM.findall(line[len("  Entities: "):])
+                continue
+            else:
+                continue
+            # A header ends the sentence block
+            expect_sentence = False
+            if sentence is not None:
+                yield sentence_year, sentence, entities
+                sentence, entities = None, []
+    if sentence is not None:
+        yield sentence_year, sentence, entities
+
+def iter_ner_jsonl(path, year=None):
+    """(year, sentence, [(entity text, label)]) from NER output JSONL (ner_inference, ensemble, ...)
+
+    The year is the given one, else meta["year"], else a year in the file name.
+    """
+    if year is None:
+        match = FILENAME_YEAR.search(os.path.basename(path))
+        year = int(match.group(1)) if match else UNKNOWN_YEAR
+    for task in iter_tasks(path):
+        if task.answer and task.answer != "accept":
+            continue
+        try:
+            task_year = int(task.meta.get("year", year))
+        except (TypeError, ValueError):
+            task_year = year
+        yield task_year, task.text, [(task.text[span.start:span.end], span.label) for span in task.spans]
+
+# ---------- Build ----------
+
+def build_index(sources, index_dir):
+    """Write the index for an iterable of (source name, records iterator)
+
+    Files:
+      sentences.bin        UTF-8 sentences, addressed by sentence_start/end
+      sentence_year.npy    year per sentence id; ids are ordered by year, so
+                           a year range is a contiguous id range
+      term_keys.bin        normalized entity texts, sorted (with term_label)
+      term_names.bin       most frequent surface form of each term
+      postings.bin         per term, its sentence ids, delta + varint encoded
+      *_offset.npy         start offsets into the .bin files (n + 1 entries)
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    starts, ends, years = array('q'), array('q'), array('h')
+    postings = defaultdict(list)  # (key, label) -> sentence ids in input order
+    names = defaultdict(Counter)
+    labels = {}
+    counts = Counter()
+
+    position = 0
+    with open(os.path.join(index_dir, "sentences.bin"), 'wb') as blob:
+        for source, records in sources:
+            for year, sentence, entities in records:
+                sentence_id = len(starts)
+                encoded = sentence.encode('utf-8')
+                blob.write(encoded)
+                starts.append(position)
+                position += len(encoded)
+                ends.append(position)
+                years.append(year)
+                for text, label in set(entities):
+                    key = normalize(text)
+                    if not key:
+                        continue
+                    label = label.upper()
+                    labels.setdefault(label, len(labels))
+                    term = (key, label)
+                    if not postings[term] or postings[term][-1] != sentence_id:
+                        postings[term].append(sentence_id)
+                    names[term][" ".join(text.split())] += 1
+                counts[source] += 1
+
+    # Renumber sentences by year (stable, so input order is kept within a year)
+    years = np.frombuffer(years, dtype=np.int16) if len(years) else np.zeros(0, dtype=np.int16)
+    order = np.argsort(years, kind='stable')
+    new_id = np.empty(len(order), dtype=np.int64)
+    new_id[order] = np.arange(len(order))
+    np.save(os.path.join(index_dir, "sentence_year.npy"), years[order])
+    np.save(os.path.join(index_dir, "sentence_start.npy"), np.asarray(starts, dtype=np.int64)[order])
+    np.save(os.path.join(index_dir, "sentence_end.npy"), np.asarray(ends, dtype=np.int64)[order])
+
+    terms = sorted(postings, key=lambda term: (term[0].encode('utf-8'), term[1]))
+    key_offset, name_offset, posting_offset = [0], [0], [0]
+    document_counts = []
+    with open(os.path.join(index_dir, "term_keys.bin"), 'wb') as keys_out, \
+            open(os.path.join(index_dir, "term_names.bin"), 'wb') as names_out, \
+            open(os.path.join(index_dir, "postings.bin"), 'wb') as postings_out:
+        for term in terms:
+            key = term[0].encode('utf-8')
+            name = names[term].most_common(1)[0][0].encode('utf-8')
+            encoded = encode_postings(np.sort(new_id[postings[term]]))
+            keys_out.write(key)
+            names_out.write(name)
+            postings_out.write(encoded)
+            key_offset.append(key_offset[-1] + len(key))
+            name_offset.append(name_offset[-1] + len(name))
+            posting_offset.append(posting_offset[-1] + len(encoded))
+            document_counts.append(len(postings[term]))
+    np.save(os.path.join(index_dir, "term_key_offset.npy"), np.array(key_offset, dtype=np.int64))
+    np.save(os.path.join(index_dir, "term_name_offset.npy"), np.array(name_offset, dtype=np.int64))
+    np.save(os.path.join(index_dir, "term_posting_offset.npy"), np.array(posting_offset, dtype=np.int64))
+    np.save(os.path.join(index_dir, "term_label.npy"), np.array([labels[label] for _, label in terms], dtype=np.int16))
+    np.save(os.path.join(index_dir, "term_count.npy"), np.array(document_counts, dtype=np.int32))
+
+    meta = {"labels": list(labels), "sentences": len(order), "terms": len(terms),
+            "postings": int(sum(document_counts)), "sources": dict(counts),
+            "years": sorted({int(y) for y in np.unique(years)})}
+    with open(os.path.join(index_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+# ---------- Query ----------
+
+class EntityIndex:
+    """Read-only, memory-mapped view of an index written by build_index"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.labels = self.meta["labels"]
+
+        def load(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+
+        def blob(name):
+            path = os.path.join(index_dir, f"{name}.bin")
+            # np.memmap cannot map an empty file
+            return np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+
+        self.sentence_year = load("sentence_year")
+        self.sentence_start, self.sentence_end = load("sentence_start"), load("sentence_end")
+        self.term_key_offset, self.term_name_offset = load("term_key_offset"), load("term_name_offset")
+        self.term_posting_offset = load("term_posting_offset")
+        self.term_label, self.term_count = load("term_label"), load("term_count")
+        self.sentences, self.term_keys = blob("sentences"), blob("term_keys")
+        self.term_names, self.postings_blob = blob("term_names"), blob("postings")
+
+    def __len__(self):
+        return len(self.term_label)
+
+    def _key(self, term):
+        return self.term_keys[self.term_key_offset[term]:self.term_key_offset[term + 1]].tobytes()
+
+    def _lower_bound(self, key):
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _label_code(self, label):
+        label = label.upper()
+        return self.labels.index(label) if label in self.labels else -1
+
+    def lookup(self, text, label=None, prefix=False):
+        """Term ids for an entity text (exact after normalization, or as a prefix), optionally one label"""
+        key = normalize(text).encode('utf-8')
+        first = self._lower_bound(key)
+        last = self._lower_bound(key + b'\xff') if prefix else first
+        if not prefix:
+            while last < len(self) and self._key(last) == key:
+                last += 1
+        terms = np.arange(first, last)
+        if label is not None:
+            terms = terms[np.asarray(self.term_label[first:last]) == self._label_code(label)]
+        return terms
+
+    def terms_with_label(self, label):
+        return np.flatnonzero(np.asarray(self.term_label) == self._label_code(label))
+
+    def name(self, term):
+        return self.term_names[self.term_name_offset[term]:self.term_name_offset[term + 1]].tobytes().decode('utf-8')
+
+    def label(self, term):
+        return self.labels[self.term_label[term]]
+
+    def year_range(self, first_year=None, last_year=None):
+        """Sentence id range [low, high) of the years"""
+        low = 0 if first_year is None else int(np.searchsorted(self.sentence_year, first_year, side='left'))
+        high = len(self.sentence_year) if last_year is None else \
+            int(np.searchsorted(self.sentence_year, last_year, side='right'))
+        return low, high
+
+    def postings(self, term, first_year=None, last_year=None):
+        """Sorted sentence ids of one term, restricted to the years"""
+        ids = decode_postings(self.postings_blob[self.term_posting_offset[term]:
+                                                 self.term_posting_offset[term + 1]].tobytes())
+        if first_year is None and last_year is None:
+            return ids
+        low, high = self.year_range(first_year, last_year)
+        return ids[np.searchsorted(ids, low):np.searchsorted(ids, high)]
+
+    def counts_in_years(self, first_year=None, last_year=None, first_term=0, last_term=None):
+        """Sentences per term in the years, for the terms [first_term, last_term), in one decode"""
+        last_term = len(self) if last_term is None else last_term
+        if (first_year is None and last_year is None) or first_term >= last_term:
+            return np.asarray(self.term_count[first_term:last_term], dtype=np.int64)
+        deltas = decode_varints(np.asarray(
+            self.postings_blob[self.term_posting_offset[first_term]:self.term_posting_offset[last_term]]))
+        # Every posting list starts with an absolute id, so a running sum restarted per term gives the ids
+        term_starts = np.concatenate(([0], np.cumsum(self.term_count[first_term:last_term - 1])))
+        totals = np.cumsum(deltas)
+        ids = totals - np.repeat(totals[term_starts] - deltas[term_starts], self.term_count[first_term:last_term])
+        low, high = self.year_range(first_year, last_year)
+        return np.add.reduceat(((ids >= low) & (ids < high)).astype(np.int64), term_starts)
+
+    def sentences_for(self, terms, first_year=None, last_year=None):
+        """Union of the terms' sentence ids in the years"""
+        lists = [self.postings(term, first_year, last_year) for term in terms]
+        return np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype=np.int64)
+
+    def sentence(self, sentence_id):
+        return self.sentences[self.sentence_start[sentence_id]:self.sentence_end[sentence_id]].tobytes().decode('utf-8')
+
+    def year(self, sentence_id):
+        return int(self.sentence_year[sentence_id])
+
+def parse_years(value):
+    """'1969-2022', '1993' or '1990-' -> (first, last); None for open ends"""
+    if not value:
+        return None, None
+    first, _, last = value.partition("-")
+    first = int(first) if first else None
+    last = (int(last) if last else None) if "-" in value else first
+    return first, last
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory-mapped entity occurrence index")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="Index directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build the index from yearly output and NER JSONL files")
+    build.add_argument("--yearly", nargs="*", default=[], help="yearly_sentences_annotated.py output files")
+    build.add_argument("--jsonl", nargs="*", default=[],
+                       help="NER output JSONL; the year comes from meta.year or a year in the file name")
+    build.add_argument("--year", type=int, default=None, help="Year for every --jsonl record")
+    build.add_argument("--volume", nargs=2, action="append", default=[], metavar=("YEAR", "JSONL"),
+                       help="NER output JSONL of one year (repeatable)")
+
+    query = subparsers.add_parser("query", help="Sentences mentioning an entity")
+    query.add_argument("text", help="Entity text (case-insensitive)")
+    query.add_argument("--label", default=None)
+    query.add_argument("--years", default=None, help="e.g. 1969-2022, 1993 or 2000-")
+    query.add_argument("--prefix", action="store_true", help="Match every entity starting with the text")
+    query.add_argument("--limit", type=int, default=20, help="Sentences to print")
+    query.add_argument("--count", action="store_true", help="Only print counts per year")
+
+    terms = subparsers.add_parser("terms", help="List entities by prefix and/or label")
+    terms.add_argument("prefix", nargs="?", default="")
+    terms.add_argument("--label", default=None)
+    terms.add_argument("--years", default=None)
+    terms.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        sources = [(path, iter_yearly_output(path)) for path in args.yearly]
+        sources += [(path, iter_ner_jsonl(path, args.year)) for path in args.jsonl]
+        sources += [(path, iter_ner_jsonl(path, int(year))) for year, path in args.volume]
+        if not sources:
+            parser.error("give at least one --yearly, --jsonl or --volume file")
+        start = time.time()
+        meta = build_index(sources, args.index)
+        print(f"Indexed {meta['sentences']} sentences, {meta['terms']} entities, {meta['postings']} postings "
+              f"in {time.time() - start:.1f}s -> {args.index}")
+        sys.exit(0)
+
+    index = EntityIndex(args.index)
+    first_year, last_year = parse_years(args.years)
+    start = time.time()
+    if args.command == "query":
+        matched = index.lookup(args.text, args.label, args.prefix)
+        ids = index.sentences_for(matched, first_year, last_year)
+        elapsed = time.time() - start
+        for term in matched[:10]:
+            print(f"{index.name(term)} ({index.label(term)}): {index.term_count[term]} sentences in total")
+        if args.count:
+            for year, count in sorted(Counter(index.year(i) for i in ids).items()):
+                print(f"  {year}: {count}")
+        else:
+            for sentence_id in ids[:args.limit]:
+                print(f"[{index.year(sentence_id)}] {index.sentence(sentence_id)}")
+        print(f"{len(ids)} sentences ({elapsed * 1000:.1f} ms)")
+    else:
+        if args.prefix:
+            matched = index.lookup(args.prefix, args.label, prefix=True)
+        elif args.label:
+            matched = index.terms_with_label(args.label)
+        else:
+            matched = np.arange(len(index))
+        if args.prefix:  # a prefix matches a contiguous run of terms
+            first = int(matched[0]) if len(matched) else 0
+            last = int(matched[-1]) + 1 if len(matched) else 0
+            counts = index.counts_in_years(first_year, last_year, first, last)[matched - first]
+        else:
+            counts = index.counts_in_years(first_year, last_year)[matched]
+        top = np.argsort(-counts, kind='stable')[:args.limit]
+        elapsed = time.time() - start
+        for i in top:
+            if counts[i]:
+                print(f"{counts[i]:>8}  {index.name(matched[i])} ({index.label(matched[i])})")
+        print(f"{len(matched)} entities ({elapsed * 1000:.1f} ms)")
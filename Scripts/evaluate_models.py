@@ -0,0 +1,141 @@
+import os
+import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import spacy
+from spacy.tokens import Doc, DocBin, Span
+from spacy.training import Example
+from spacy.util import filter_spans
+from ner_inference import load_ner_pipeline, model_names
+from annotation_records import iter_tasks
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_GOLD_DIR = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_DIR, "evaluation")
+
+def gold_docs_from_jsonl(jsonl_path, vocab):
+    """Build reference Docs from accepted Prodigy ner_manual records"""
+    for task in iter_tasks(jsonl_path):
+        if task.answer != "accept" or not task.tokens:
+            continue
+        doc = Doc(vocab,
+                  words=[token.text for token in task.tokens],
+                  spaces=[token.ws for token in task.tokens])
+        spans = [Span(doc, span.token_start, span.token_end + 1, label=span.label)
+                 for span in task.spans]
+        # Tokens outside the spans were reviewed by the annotator, so they are O
+        doc.set_ents(filter_spans(spans), default="outside")
+        yield doc
+
+def cached_gold_path(jsonl_path, cache_dir):
+    """Cache file for a gold set, keyed by the content hash of its JSONL"""
+    with open(jsonl_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(jsonl_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest}.spacy")
+
+def build_gold_cache(gold_paths, cache_dir):
+    """Parse each gold JSONL once into a DocBin shared by every model; return {name: path}"""
+    os.makedirs(cache_dir, exist_ok=True)
+    vocab = spacy.blank("en").vocab
+    cached = {}
+    for jsonl_path in gold_paths:
+        name = os.path.splitext(os.path.basename(jsonl_path))[0]
+        cache_path = cached_gold_path(jsonl_path, cache_dir)
+        if not os.path.exists(cache_path):
+            doc_bin = DocBin(attrs=["ORTH", "SPACY", "ENT_IOB", "ENT_TYPE"])
+            for doc in gold_docs_from_jsonl(jsonl_path, vocab):
+                doc_bin.add(doc)
+            doc_bin.to_disk(cache_path)
+            print(f"Cached {len(doc_bin)} gold docs from {jsonl_path}")
+        cached[name] = cache_path
+    return cached
+
+def evaluate_model(model_path, gold_sets, batch_size=256):
+    """Score one model against every cached gold set (runs in a worker process)"""
+    nlp = load_ner_pipeline(model_path)
+    scores = {}
+    for name, cache_path in gold_sets.items():
+        examples = []
+        for reference in DocBin().from_disk(cache_path).get_docs(nlp.vocab):
+            predicted = Doc(nlp.vocab, words=[t.text for t in reference],
+                            spaces=[bool(t.whitespace_) for t in reference])
+            examples.append(Example(predicted, reference))
+        result = nlp.evaluate(examples, batch_size=batch_size)
+        scores[name] = {
+            "ents_p": result["ents_p"],
+            "ents_r": result["ents_r"],
+            "ents_f": result["ents_f"],
+            "ents_per_type": result.get("ents_per_type") or {},
+            "docs": len(examples),
+        }
+    return scores
+
+def format_matrix(results, gold_names):
+    """Markdown report: overall F per model x gold set, then per-label P/R/F per gold set"""
+    lines = ["# NER evaluation", "", "## Overall F-score", ""]
+    lines.append("| model | " + " | ".join(gold_names) + " |")
+    lines.append("|---" * (len(gold_names) + 1) + "|")
+    for model in sorted(results):
+        cells = [f"{results[model][gold]['ents_f']:.3f}" for gold in gold_names]
+        lines.append(f"| {model} | " + " | ".join(cells) + " |")
+
+    for gold in gold_names:
+        labels = sorted({label for model in results for label in results[model][gold]["ents_per_type"]})
+        lines += ["", f"## {gold} (P / R / F per label)", ""]
+        lines.append("| model | " + " | ".join(labels) + " |")
+        lines.append("|---" * (len(labels) + 1) + "|")
+        for model in sorted(results):
+            per_type = results[model][gold]["ents_per_type"]
+            cells = []
+            for label in labels:
+                if label in per_type:
+                    s = per_type[label]
+                    cells.append(f"{s['p']:.2f} / {s['r']:.2f} / {s['f']:.2f}")
+                else:
+                    cells.append("-")
+            lines.append(f"| {model} | " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+def evaluate_all(model_paths, gold_paths, output_dir, workers=None, batch_size=256):
+    """Score every model against every gold set and write scores.json and scores.md"""
+    # model-best and model-last of one model must not overwrite each other's scores
+    names = dict(zip(model_paths, model_names(model_paths)))
+    gold_sets = build_gold_cache(gold_paths, os.path.join(output_dir, "gold_cache"))
+    gold_names = list(gold_sets)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or min(len(model_paths), os.cpu_count() or 1)) as pool:
+        futures = {pool.submit(evaluate_model, path, gold_sets, batch_size): path for path in model_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[names[path]] = future.result()
+                print(f"Evaluated {path}")
+            except Exception as e:
+                print(f"Error evaluating {path}: {e}")
+
+    with open(os.path.join(output_dir, "scores.json"), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    report = format_matrix(results, gold_names)
+    with open(os.path.join(output_dir, "scores.md"), 'w', encoding='utf-8') as f:
+        f.write(report)
+    return results, report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate every trained model against every checked gold set")
+    parser.add_argument("--models", nargs="*",
+                        default=sorted(glob.glob(os.path.join(PROJECT_DIR, "model_0*", "model-best"))),
+                        help="Pipeline directories (default: model_0*/model-best)")
+    parser.add_argument("--gold", nargs="*",
+                        default=sorted(glob.glob(os.path.join(DEFAULT_GOLD_DIR, "*.jsonl"))),
+                        help="Gold JSONL files (default: Checked_Annotations/*.jsonl)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Directory for scores and the gold cache")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel model processes")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    _, report = evaluate_all(args.models, args.gold, args.output, args.workers, args.batch_size)
+    print("\n" + report)
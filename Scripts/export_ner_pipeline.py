@@ -0,0 +1,110 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import spacy
+from ner_inference import ner_components, read_records
+from memory_usage import rss_mb
+
+DEFAULT_ANNOTATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "Checked_Annotations")
+
+def export_ner_pipeline(model_path, output_path):
+    """Write a copy of the pipeline with only NER and the components its output depends on
+
+    Those are ner_inference.ner_components: the parser stays in the model_0x
+    pipelines because ner follows the sentence boundaries it sets.
+    """
+    keep, dropped = ner_components(model_path)
+    slim = spacy.load(model_path, exclude=dropped)
+    slim.meta["name"] = f"{slim.meta.get('name', 'pipeline')}_ner"
+    slim.meta["description"] = f"NER-only export of {model_path} (dropped: {', '.join(dropped)})"
+    slim.to_disk(output_path)
+    print(f"Exported {output_path}: kept {keep}, dropped {dropped}")
+    return keep, dropped
+
+def load_texts(annotation_dir):
+    """All texts from the checked annotation files, in file order"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(annotation_dir, "*.jsonl"))):
+        texts.extend(text for text, _ in read_records(path))
+    return texts
+
+def compare_entities(model_path, export_path, texts, batch_size=256):
+    """Return the texts whose entities differ between the full and exported pipelines"""
+    full = spacy.load(model_path)
+    slim = spacy.load(export_path)
+    mismatches = []
+    docs = zip(full.pipe(texts, batch_size=batch_size), slim.pipe(texts, batch_size=batch_size))
+    for full_doc, slim_doc in docs:
+        full_ents = [(e.start_char, e.end_char, e.label_) for e in full_doc.ents]
+        slim_ents = [(e.start_char, e.end_char, e.label_) for e in slim_doc.ents]
+        if full_ents != slim_ents:
+            mismatches.append((full_doc.text, full_ents, slim_ents))
+    return mismatches
+
+def _measure(model_path, texts, batch_size):
+    """Run in a fresh process: load time, RSS and throughput of one pipeline"""
+    baseline_rss = rss_mb()
+    start = time.time()
+    nlp = spacy.load(model_path)
+    load_time = time.time() - start
+    start = time.time()
+    words = sum(len(doc) for doc in nlp.pipe(texts, batch_size=batch_size))
+    elapsed = time.time() - start
+    return {
+        "load_s": load_time,
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - baseline_rss,
+        "words_per_s": words / elapsed if elapsed else 0,
+    }
+
+def measure(model_path, texts, batch_size=256):
+    # A new spawned process per pipeline so load time and memory aren't shared
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure, model_path, texts, batch_size).result()
+
+def report(full_stats, slim_stats):
+    print(f"\n{'':14}{'full':>12}{'ner-only':>12}{'ratio':>8}")
+    for key, label in [("load_s", "load (s)"), ("rss_mb", "RSS MB"),
+                       ("rss_growth_mb", "RSS growth MB"), ("words_per_s", "words/s")]:
+        full_value, slim_value = full_stats[key], slim_stats[key]
+        ratio = slim_value / full_value if full_value else 0
+        print(f"{label:14}{full_value:>12.2f}{slim_value:>12.2f}{ratio:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export an NER-only copy of a trained pipeline")
+    parser.add_argument("model", help="Pipeline directory, e.g. model_04/model-best")
+    parser.add_argument("output", help="Directory for the NER-only pipeline")
+    parser.add_argument("--annotations", default=DEFAULT_ANNOTATIONS,
+                        help="Checked annotation JSONL files used for verification")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--no-verify", action="store_true", help="Skip the comparison and benchmark")
+    args = parser.parse_args()
+
+    if args.no_verify:
+        export_ner_pipeline(args.model, args.output)
+        sys.exit(0)
+
+    # Export next to the output and only move it into place once the entities match
+    staging = os.path.normpath(args.output) + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    export_ner_pipeline(args.model, staging)
+    texts = load_texts(args.annotations)
+    mismatches = compare_entities(args.model, staging, texts, args.batch_size)
+    for text, full_ents, slim_ents in mismatches[:10]:
+        print(f"Mismatch: {text[:80]!r}\n  full: {full_ents}\n  ner-only: {slim_ents}")
+    print(f"Entities identical on {len(texts) - len(mismatches)}/{len(texts)} texts")
+    if mismatches:
+        shutil.rmtree(staging)
+        print(f"Export aborted: the NER-only pipeline changes the entities; {args.output} was not written")
+        sys.exit(1)
+    shutil.rmtree(args.output, ignore_errors=True)
+    os.replace(staging, args.output)
+    print(f"Verified and saved {args.output}")
+
+    report(measure(args.model, texts, args.batch_size), measure(args.output, texts, args.batch_size))
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+# 默认缓存上限（字节），超出后按最近访问时间淘汰
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    pdf_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    raw_text TEXT NOT NULL,
+    ocr_text TEXT,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (pdf_hash, page, settings)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    pdf_hash TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    clean_version TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    output_size INTEGER NOT NULL,
+    sentence_count INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (pdf_hash, settings, clean_version)
+);
+"""
+
+def open_cache(cache_path):
+    """打开（或创建）提取缓存数据库"""
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path)
+    conn.executescript(_SCHEMA)
+    return conn
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """按内容计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def settings_key(**settings):
+    """把提取参数（DPI、Tesseract 配置等）压缩成缓存键"""
+    encoded = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def get_pages(conn, pdf_hash, settings):
+    """读取一个PDF已缓存的页面，返回 {页码: (原始文本, OCR文本或None)}"""
+    rows = conn.execute(
+        "SELECT page, raw_text, ocr_text FROM pages WHERE pdf_hash = ? AND settings = ?",
+        (pdf_hash, settings)).fetchall()
+    if rows:
+        conn.execute("UPDATE pages SET accessed = ? WHERE pdf_hash = ? AND settings = ?",
+                     (time.time(), pdf_hash, settings))
+        conn.commit()
+    return {page: (raw_text, ocr_text) for page, raw_text, ocr_text in rows}
+
+def put_pages(conn, pdf_hash, settings, pages):
+    """写入页面缓存，pages 为 {页码: (原始文本, OCR文本或None)}"""
+    now = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(pdf_hash, page, settings, raw_text, ocr_text,
+          len(raw_text.encode('utf-8')) + len((ocr_text or '').encode('utf-8')), now)
+         for page, (raw_text, ocr_text) in pages.items()])
+    conn.commit()
+
+def is_document_current(conn, pdf_hash, settings, clean_version, output_path):
+    """该PDF在当前设置和清理规则下的输出是否已存在且未被改动"""
+    row = conn.execute(
+        "SELECT output_path, output_size FROM documents "
+        "WHERE pdf_hash = ? AND settings = ? AND clean_version = ?",
+        (pdf_hash, settings, clean_version)).fetchone()
+    if row is None or row[0] != output_path or not os.path.exists(output_path):
+        return False
+    if os.path.getsize(output_path) != row[1]:
+        return False
+    conn.execute("UPDATE documents SET accessed = ? WHERE pdf_hash = ? AND settings = ? AND clean_version = ?",
+                 (time.time(), pdf_hash, settings, clean_version))
+    conn.commit()
+    return True
+
+def put_document(conn, pdf_hash, settings, clean_version, output_path, sentence_count):
+    """记录一个PDF已在当前设置和清理规则下完成输出"""
+    conn.execute(
+        "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (pdf_hash, settings, clean_version, output_path,
+         os.path.getsize(output_path), sentence_count, time.time()))
+    conn.commit()
+
+def invalidate(conn, clean_version=None, pages=False):
+    """使缓存失效
+
+    clean_version: 删除清理规则版本不等于它的文档记录（页面文本仍可复用）
+    pages: 同时清空页面文本缓存（提取或OCR方式变化时使用）
+    """
+    if clean_version is None:
+        removed = conn.execute("DELETE FROM documents").rowcount
+    else:
+        removed = conn.execute("DELETE FROM documents WHERE clean_version != ?",
+                               (clean_version,)).rowcount
+    if pages:
+        removed += conn.execute("DELETE FROM pages").rowcount
+    conn.commit()
+    return removed
+
+def evict(conn, max_bytes=DEFAULT_MAX_BYTES):
+    """页面缓存超过 max_bytes 时，按最近访问时间从旧到新淘汰"""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    to_free = total - max_bytes
+    doomed = []
+    for rowid, size in conn.execute("SELECT rowid, size FROM pages ORDER BY accessed"):
+        doomed.append((rowid,))
+        to_free -= size
+        if to_free <= 0:
+            break
+    conn.executemany("DELETE FROM pages WHERE rowid = ?", doomed)
+    conn.commit()
+    conn.execute("VACUUM")
+    return len(doomed)
@@ -0,0 +1,213 @@
+import os
+import re
+import glob
+import json
+import time
+import argparse
+import numpy as np
+from collections import Counter, defaultdict
+import spacy
+from spacy.language import Language
+from spacy.tokens import Span
+from annotation_records import iter_tasks
+from ner_inference import load_ner_pipeline, model_name, read_records, doc_to_task
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_GAZETTEER = os.path.join(PROJECT_DIR, "gazetteer")
+
+GAZETTEER_LABELS = ("MOUNTAIN", "VALLEY", "CITY")
+# //geo/g types in the _en-ner.xml files that correspond to our labels
+GEO_TYPE_LABELS = {"mountain": "MOUNTAIN", "valley": "VALLEY", "city": "CITY"}
+
+def gazetteer_from_annotations(annotation_dir, labels=GAZETTEER_LABELS):
+    """Count (text, label) for every accepted span with one of the labels"""
+    counts = Counter()
+    for jsonl_path in sorted(glob.glob(os.path.join(annotation_dir, "*.jsonl"))):
+        for task in iter_tasks(jsonl_path):
+            if task.answer != "accept":
+                continue
+            for span in task.spans:
+                if span.label in labels:
+                    counts[task.text[span.start:span.end], span.label] += 1
+    return counts
+
+def gazetteer_from_geo(input_dir):
+    """Count (text, label) for the //geo/g entities of every _en.xml / _en-ner.xml pair"""
+    from combine_merge import extract_entities, load_word_mapping
+    from xml_loader import load_text_xml
+
+    counts = Counter()
+    for text_xml in sorted(glob.glob(os.path.join(input_dir, "*_en.xml"))):
+        ner_xml = text_xml.replace('_en.xml', '_en-ner.xml')
+        if not os.path.exists(ner_xml):
+            continue
+        words, _ = load_text_xml(text_xml)
+        for entity in extract_entities(ner_xml, load_word_mapping(words)):
+            label = GEO_TYPE_LABELS.get((entity['type'] or '').lower())
+            if label:
+                # Words are space-joined in the XML; reattach punctuation like the text reconstruction
+                counts[re.sub(r'\s([,.!?])', r'\1', entity['text']), label] += 1
+    return counts
+
+def resolve_labels(counts):
+    """One label per text: the most frequent one (ties go to the label seen first)"""
+    by_text = defaultdict(Counter)
+    for (text, label), count in counts.items():
+        text = " ".join(text.split())
+        if text:
+            by_text[text][label] += count
+    return {text: labels.most_common(1)[0][0] for text, labels in by_text.items()}
+
+class Gazetteer:
+    """Pipeline component that labels gazetteer matches before the statistical NER
+
+    Patterns are compiled into a table keyed by the tuple of token ORTH hashes,
+    which spaCy derives from the text alone, so the table is saved as plain
+    NumPy arrays and loads without tokenizing or building a Doc per pattern
+    (what a serialized PhraseMatcher/EntityRuler has to do on startup).
+    Overlaps are resolved like PhraseMatcher plus filter_spans. Matches
+    never overwrite entities already on the Doc; the NER that runs afterwards
+    keeps them and predicts the rest.
+    """
+
+    def __init__(self, vocab, name="gazetteer"):
+        self.vocab = vocab
+        self.name = name
+        self.labels = []
+        self.table = {}  # tuple of ORTH hashes -> label index
+        self.lengths = []  # pattern lengths in tokens, longest first
+
+    def add_patterns(self, nlp, entries):
+        """entries: {text: label}"""
+        for doc, label in zip(nlp.tokenizer.pipe(entries.keys()), entries.values()):
+            if label not in self.labels:
+                self.labels.append(label)
+            self.table[tuple(token.orth for token in doc)] = self.labels.index(label)
+        self._update_lengths()
+
+    def _update_lengths(self):
+        self.lengths = sorted({len(key) for key in self.table}, reverse=True)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __call__(self, doc):
+        if not self.table:
+            return doc
+        orths = [token.orth for token in doc]
+        taken = [False] * len(doc)
+        for ent in doc.ents:
+            taken[ent.start:ent.end] = [True] * len(ent)
+
+        # Every candidate, then longest first (earlier start on ties), as filter_spans does
+        candidates = []
+        for start in range(len(orths)):
+            for length in self.lengths:
+                if start + length <= len(orths):
+                    label = self.table.get(tuple(orths[start:start + length]))
+                    if label is not None:
+                        candidates.append((-length, start, label))
+        matches = []
+        for length, start, label in sorted(candidates):
+            end = start - length
+            if not any(taken[start:end]):
+                taken[start:end] = [True] * (end - start)
+                matches.append(Span(doc, start, end, label=self.labels[label]))
+        if matches:
+            doc.set_ents(matches, default="unmodified")
+        return doc
+
+    def to_disk(self, path, exclude=tuple()):
+        os.makedirs(path, exist_ok=True)
+        keys = list(self.table)
+        np.save(os.path.join(path, "tokens.npy"),
+                np.fromiter((orth for key in keys for orth in key), dtype=np.uint64))
+        # int32: uint8 silently wrapped phrases over 255 tokens and label indices over 255
+        np.save(os.path.join(path, "lengths.npy"), np.fromiter(map(len, keys), dtype=np.int32, count=len(keys)))
+        np.save(os.path.join(path, "labels.npy"), np.fromiter(self.table.values(), dtype=np.int32, count=len(keys)))
+        with open(os.path.join(path, "labels.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.labels, f)
+
+    def from_disk(self, path, exclude=tuple()):
+        tokens = np.load(os.path.join(path, "tokens.npy")).tolist()
+        lengths = np.load(os.path.join(path, "lengths.npy")).tolist()
+        labels = np.load(os.path.join(path, "labels.npy")).tolist()
+        with open(os.path.join(path, "labels.json"), 'r', encoding='utf-8') as f:
+            self.labels = json.load(f)
+        self.table = {}
+        position = 0
+        for length, label in zip(lengths, labels):
+            self.table[tuple(tokens[position:position + length])] = label
+            position += length
+        self._update_lengths()
+        return self
+
+@Language.factory("gazetteer")
+def make_gazetteer(nlp, name):
+    return Gazetteer(nlp.vocab, name)
+
+def build_gazetteer(output_dir, annotation_dir=DEFAULT_ANNOTATIONS, geo_dir=None):
+    """Collect the gazetteer, compile it and save the component to output_dir"""
+    counts = gazetteer_from_annotations(annotation_dir)
+    if geo_dir:
+        counts.update(gazetteer_from_geo(geo_dir))
+    entries = resolve_labels(counts)
+
+    nlp = spacy.blank("en")
+    gazetteer = nlp.add_pipe("gazetteer")
+    gazetteer.add_patterns(nlp, entries)
+    gazetteer.to_disk(output_dir)
+    print(f"Saved {len(gazetteer)} patterns to {output_dir}: {dict(Counter(entries.values()))}")
+    return gazetteer
+
+def load_with_gazetteer(model_path, gazetteer_dir):
+    """NER pipeline with the saved gazetteer inserted ahead of ner"""
+    nlp = load_ner_pipeline(model_path)
+    start = time.time()
+    nlp.add_pipe("gazetteer", before="ner").from_disk(gazetteer_dir)
+    print(f"Loaded gazetteer in {time.time() - start:.2f}s")
+    return nlp
+
+def pre_annotate(model_path, gazetteer_dir, input_path, output_path, batch_size=256, save_pipeline=None):
+    """Write pre-labeled Prodigy JSONL (gazetteer matches plus model predictions)"""
+    nlp = load_with_gazetteer(model_path, gazetteer_dir)
+    if save_pipeline:
+        nlp.to_disk(save_pipeline)
+        print(f"Saved pipeline to {save_pipeline} (load with -F Scripts/gazetteer.py in Prodigy)")
+
+    source = f"{model_name(model_path)}+gazetteer"
+    count = 0
+    start = time.time()
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for doc, meta in nlp.pipe(read_records(input_path), as_tuples=True, batch_size=batch_size):
+            out.write(json.dumps(doc_to_task(doc, source, meta), ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Pre-annotated {count} texts in {time.time() - start:.1f}s -> {output_path}")
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gazetteer pre-annotation for Prodigy")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Compile the gazetteer from the checked annotations")
+    build.add_argument("--output", default=DEFAULT_GAZETTEER, help="Directory for the compiled gazetteer")
+    build.add_argument("--annotations", default=DEFAULT_ANNOTATIONS)
+    build.add_argument("--geo-dir", default=None,
+                       help="Directory of _en.xml / _en-ner.xml pairs whose //geo/g entities are added")
+
+    annotate = subparsers.add_parser("annotate", help="Pre-label sentences with gazetteer + model")
+    annotate.add_argument("model", help="Pipeline directory, e.g. model_04/model-best")
+    annotate.add_argument("input", help="Sentence file (one per line) or JSONL with a \"text\" field")
+    annotate.add_argument("output", help="Pre-labeled JSONL for Prodigy")
+    annotate.add_argument("--gazetteer", default=DEFAULT_GAZETTEER)
+    annotate.add_argument("--batch-size", type=int, default=256)
+    annotate.add_argument("--save-pipeline", default=None,
+                          help="Also save the combined pipeline for prodigy ner.correct")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_gazetteer(args.output, args.annotations, args.geo_dir)
+    else:
+        pre_annotate(args.model, args.gazetteer, args.input, args.output,
+                     args.batch_size, args.save_pipeline)
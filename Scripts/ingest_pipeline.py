@@ -0,0 +1,340 @@
+import os
+import sys
+import glob
+import json
+import time
+import fnmatch
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from extraction_cache import file_hash
+from thread_env import thread_env
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(PROJECT_DIR, "pipeline.json")
+
+# ---------- Stages ----------
+
+def stage(name, script, args, inputs, outputs, cpus=1, parallel_args=()):
+    """One node of the graph: `python Scripts/<script> <args>`
+
+    inputs / outputs are file paths or glob patterns. A stage depends on the
+    stages whose outputs it reads. cpus is the stage's share of the CPU
+    budget; parallel_args pass it on and, unlike args, do not invalidate a
+    finished stage when they change.
+    """
+    return {"name": name, "command": [script, *args], "parallel_args": list(parallel_args),
+            "inputs": list(inputs), "outputs": list(outputs), "cpus": cpus}
+
+def build_stages(config, base_dir, cpus):
+    """The stage graph for a pipeline config; relative paths are resolved against base_dir
+
+    Per volume (year): extract (OCR, unless the volume lists ready-made
+    sentence files) -> merge -> dedup -> ner -> xml; a volume with a Prodigy
+    export only gets xml. Across volumes: the entity index over every
+    volume's entities, and yearly and combine, which read only xml_dir (the
+    Cleaned_Alpine_Journal _en.xml / _en-ner.xml pairs), not the volumes.
+    """
+    def path(value):
+        return os.path.normpath(os.path.join(base_dir, value))
+
+    work_dir = path(config.get("work_dir", "pipeline"))
+    model = path(config["model"]) if config.get("model") else None
+    ocr_workers = min(config.get("ocr_workers", cpus), cpus)
+    ner_processes = min(config.get("ner_processes", 1), cpus)
+    stages = []
+    index_sources = []
+
+    for year, volume in sorted(config.get("volumes", {}).items()):
+        volume_dir = os.path.join(work_dir, year)
+        # Prodigy review happens outside the pipeline; once the export exists it replaces the
+        # model output, and nothing reads the volume's sentences any more
+        if volume.get("annotations"):
+            entities = path(volume["annotations"])
+        else:
+            entities = None
+            if volume.get("pdfs"):
+                pdfs = path(volume["pdfs"])
+                sentences = os.path.join(volume_dir, "sentences")
+                # One extraction cache per volume, so concurrent volumes never wait on each other's SQLite lock
+                stages.append(stage(f"extract:{year}", "OCR_sentence_segmentation.py",
+                                    ["--folder", pdfs, "--output", sentences,
+                                     "--cache", os.path.join(volume_dir, ".extraction_cache.sqlite")],
+                                    [os.path.join(pdfs, "*.pdf")], [os.path.join(sentences, "*.txt")],
+                                    cpus=ocr_workers, parallel_args=["--workers", str(ocr_workers)]))
+            else:
+                sentences = path(volume["sentences"])  # e.g. manually_extracted_sentences
+
+            merged = os.path.join(volume_dir, "merged.txt")
+            stages.append(stage(f"merge:{year}", "merge_txt.py",
+                                ["--mode", "simple", "--folders", sentences, "--output", merged],
+                                [os.path.join(sentences, "*.txt")], [merged]))
+            # sentences.txt is also what gets loaded into Prodigy for review
+            deduped = os.path.join(volume_dir, "sentences.txt")
+            report = os.path.join(volume_dir, "sentences.clusters.jsonl")
+            stages.append(stage(f"dedup:{year}", "dedup_sentences.py", [merged, deduped, "--report", report],
+                                [merged], [deduped, report]))
+
+            if model:
+                entities = os.path.join(volume_dir, f"ner_{year}.jsonl")
+                stages.append(stage(f"ner:{year}", "ner_inference.py", [model, deduped, entities],
+                                    [deduped, os.path.join(model, "config.cfg"), os.path.join(model, "*", "model")],
+                                    [entities], cpus=ner_processes, parallel_args=["--n-process", str(ner_processes)]))
+        if entities:
+            # The volume's final XML, like Checked_Annotations/*.xml; no later stage reads it
+            stem = os.path.splitext(os.path.basename(entities))[0]
+            stages.append(stage(f"xml:{year}", "convert_jsonl_to_xml.py",
+                                [os.path.basename(entities), "--input-dir", os.path.dirname(entities),
+                                 "--output-dir", volume_dir],
+                                [entities], [os.path.join(volume_dir, stem + ".xml")]))
+            index_sources.append((year, entities))
+
+    yearly = None
+    if config.get("xml_dir"):
+        xml_dir = path(config["xml_dir"])
+        xml_inputs = [os.path.join(xml_dir, "*_en.xml"), os.path.join(xml_dir, "*_en-ner.xml")]
+        xml_workers = min(config.get("xml_workers", cpus), cpus)
+        yearly = os.path.join(work_dir, "yearly_sentences_annotated.txt")
+        stages.append(stage("yearly", "yearly_sentences_annotated.py", ["--input-dir", xml_dir, "--output", yearly],
+                            xml_inputs, [yearly], cpus=xml_workers, parallel_args=["--workers", str(xml_workers)]))
+        combined = os.path.join(work_dir, "prodigy_annotated.txt")
+        stages.append(stage("combine", "combine_merge.py", ["--input-dir", xml_dir, "--output", combined],
+                            xml_inputs, [combined], cpus=xml_workers, parallel_args=["--workers", str(xml_workers)]))
+
+    if yearly or index_sources:
+        index_dir = os.path.join(work_dir, "entity_index")
+        args = ["--index", index_dir, "build"] + (["--yearly", yearly] if yearly else [])
+        for year, entities in index_sources:
+            args += ["--volume", year, entities]
+        stages.append(stage("index", "entity_index.py", args,
+                            ([yearly] if yearly else []) + [entities for _, entities in index_sources],
+                            [os.path.join(index_dir, "meta.json"), os.path.join(index_dir, "*.npy"),
+                             os.path.join(index_dir, "*.bin")]))
+    return stages, work_dir
+
+def dependencies(stages):
+    """{stage name: names of the stages producing its inputs}"""
+    producers = {pattern: s["name"] for s in stages for pattern in s["outputs"]}
+    return {s["name"]: {producers[p] for p in s["inputs"] if p in producers and producers[p] != s["name"]}
+            for s in stages}
+
+def topological_order(stages, deps):
+    """Stages ordered so every stage comes after its dependencies (config order otherwise)"""
+    ordered, done = [], set()
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if deps[s["name"]] <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle among: {', '.join(s['name'] for s in remaining)}")
+        for s in ready:
+            ordered.append(s)
+            done.add(s["name"])
+            remaining.remove(s)
+    return ordered
+
+def select(stages, deps, patterns):
+    """Stages matching any of the name patterns (e.g. '*:2023'), plus everything they depend on"""
+    wanted = {s["name"] for s in stages if any(fnmatch.fnmatch(s["name"], p) for p in patterns)}
+    queue = list(wanted)
+    while queue:
+        for dependency in deps[queue.pop()] - wanted:
+            wanted.add(dependency)
+            queue.append(dependency)
+    return [s for s in stages if s["name"] in wanted]
+
+# ---------- Manifests ----------
+
+def _is_glob(pattern):
+    return any(c in pattern for c in "*?[")
+
+def hash_files(patterns, previous=None):
+    """{path: {"sha256", "size", "mtime_ns"}} for the existing files matching the patterns
+
+    A file whose size and mtime match its entry in previous is not re-read.
+    """
+    previous = previous or {}
+    hashes = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) if _is_glob(pattern) else [pattern]:
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entry = previous.get(path)
+            if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                entry = {"sha256": file_hash(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            hashes[path] = entry
+    return hashes
+
+def _digests(hashes):
+    return {path: entry["sha256"] for path, entry in hashes.items()}
+
+def manifest_path(work_dir, name):
+    return os.path.join(work_dir, "manifests", name.replace(":", "-") + ".json")
+
+def write_manifest(work_dir, manifest):
+    path = manifest_path(work_dir, manifest["stage"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+def read_manifest(work_dir, name):
+    try:
+        with open(manifest_path(work_dir, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def check_stage(stage, manifest):
+    """(input hashes, reason to run); the reason is None when the stage is up to date"""
+    previous = manifest or {}
+    inputs = hash_files(stage["inputs"], previous.get("inputs"))
+    missing = [p for p in stage["inputs"] if not _is_glob(p) and p not in inputs]
+    if missing:
+        return inputs, f"missing input {missing[0]}"
+    if manifest is None:
+        return inputs, "never run"
+    if manifest["command"] != stage["command"]:
+        return inputs, "command changed"
+    if _digests(inputs) != _digests(manifest["inputs"]):
+        return inputs, "inputs changed"
+    if _digests(hash_files(stage["outputs"], manifest["outputs"])) != _digests(manifest["outputs"]):
+        return inputs, "outputs changed"
+    return inputs, None
+
+# ---------- Scheduler ----------
+
+def run_stage(stage, work_dir):
+    """Run one stage's script with its output in logs/<stage>.log; returns (returncode, seconds)"""
+    log_path = os.path.join(work_dir, "logs", stage["name"].replace(":", "-") + ".log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    # Stages get their parallelism from parallel_args; keep BLAS/OpenMP pools from adding threads on top
+    env = dict(os.environ, PYTHONUNBUFFERED="1", **thread_env(1))
+    script, *args = stage["command"]
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, script), *args, *stage["parallel_args"]]
+    start = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=PROJECT_DIR).returncode
+    return returncode, time.time() - start
+
+def plan(stages, deps, work_dir, forced=()):
+    """[(stage, reason or None)] without running anything"""
+    planned = {}
+    for s in stages:
+        if any(planned.get(d) for d in deps[s["name"]]):
+            planned[s["name"]] = "upstream will run"
+        else:
+            _, reason = check_stage(s, read_manifest(work_dir, s["name"]))
+            planned[s["name"]] = reason or ("forced" if s["name"] in forced else None)
+    return [(s, planned[s["name"]]) for s in stages]
+
+def run_pipeline(stages, deps, work_dir, cpus, forced=()):
+    """Run the stages that are out of date, as many at a time as the CPU budget allows
+
+    A stage starts once everything it depends on has finished and its cpus
+    fit in what is left of the budget. Before starting it, its inputs are
+    hashed and compared with its manifest; when nothing changed it is
+    skipped, so re-running the pipeline after adding a volume only runs
+    that volume's stages and the stages that combine all volumes. A failed
+    stage writes no manifest and blocks only the stages downstream of it.
+    Stages named in forced run even when up to date.
+    """
+    state = {}  # name -> "done" / "skipped" / "failed" / "blocked"
+    checked = {}
+    pending = list(stages)
+    running = {}
+    used = 0
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, len(stages))) as pool:
+        while pending or running:
+            for s in list(pending):
+                name = s["name"]
+                upstream = [state.get(d) for d in deps[name]]
+                if any(u in ("failed", "blocked") for u in upstream):
+                    state[name] = "blocked"
+                    pending.remove(s)
+                    print(f"⛔ {name}: blocked by a failed stage")
+                    continue
+                if not all(u in ("done", "skipped") for u in upstream):
+                    continue
+                if name not in checked:
+                    manifest = read_manifest(work_dir, name)
+                    checked[name] = check_stage(s, manifest)
+                    # Same content, new mtime (copied, touched): keep the new stats so it is not hashed again
+                    if checked[name][1] is None and checked[name][0] != manifest["inputs"]:
+                        write_manifest(work_dir, dict(manifest, inputs=checked[name][0]))
+                inputs, reason = checked[name]
+                if reason is None and name not in forced:
+                    state[name] = "skipped"
+                    pending.remove(s)
+                    print(f"⏭️ {name}: up to date")
+                    continue
+                if reason and reason.startswith("missing input"):
+                    state[name] = "failed"
+                    pending.remove(s)
+                    print(f"❌ {name}: {reason}")
+                    continue
+                need = min(s["cpus"], cpus)
+                if used + need > cpus:
+                    continue
+                used += need
+                pending.remove(s)
+                print(f"▶️ {name} ({reason or 'forced'}, {need} CPU)")
+                running[pool.submit(run_stage, s, work_dir)] = (s, inputs, need)
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                s, inputs, need = running.pop(future)
+                used -= need
+                name = s["name"]
+                returncode, seconds = future.result()
+                outputs = hash_files(s["outputs"])
+                missing = [p for p in s["outputs"] if not _is_glob(p) and p not in outputs]
+                log_path = os.path.join(work_dir, "logs", name.replace(":", "-") + ".log")
+                if returncode or missing or not outputs:
+                    state[name] = "failed"
+                    problem = f"exit code {returncode}" if returncode else f"no output {(missing or s['outputs'])[0]}"
+                    print(f"❌ {name}: {problem} after {seconds:.1f}s, see {log_path}")
+                    continue
+                write_manifest(work_dir, {"stage": name, "command": s["command"], "inputs": inputs, "outputs": outputs,
+                                          "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                          "seconds": round(seconds, 1)})
+                state[name] = "done"
+                print(f"✅ {name} in {seconds:.1f}s")
+
+    counts = {key: list(state.values()).count(key) for key in ("done", "skipped", "failed", "blocked")}
+    print(f"\n📊 {counts['done']} run, {counts['skipped']} up to date, {counts['failed']} failed, "
+          f"{counts['blocked']} blocked in {time.time() - start:.1f}s")
+    return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ingest pipeline as a graph of incremental stages")
+    parser.add_argument("config", nargs="?", default=DEFAULT_CONFIG, help="Pipeline JSON config")
+    parser.add_argument("--cpus", type=int, default=None,
+                        help="CPU budget shared by all running stages (default: config \"cpus\" or every CPU)")
+    parser.add_argument("--only", nargs="+", default=None,
+                        help="Stage name patterns to run, plus their dependencies, e.g. '*:2023' or index")
+    parser.add_argument("--force", action="store_true",
+                        help="Run the stages matching --only (or all stages) even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which stages would run and why")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    cpus = max(1, args.cpus or config.get("cpus") or os.cpu_count() or 1)
+    stages, work_dir = build_stages(config, os.path.dirname(os.path.abspath(args.config)), cpus)
+    deps = dependencies(stages)
+    stages = topological_order(stages, deps)
+    if args.only:
+        stages = select(stages, deps, args.only)
+    forced = {s["name"] for s in stages if args.force and (not args.only or
+                                                          any(fnmatch.fnmatch(s["name"], p) for p in args.only))}
+
+    if args.dry_run:
+        for s, reason in plan(stages, deps, work_dir, forced):
+            print(f"{'run ' if reason else 'skip'}  {s['name']:<16} {reason or 'up to date'}")
+        sys.exit(0)
+    state = run_pipeline(stages, deps, work_dir, cpus, forced)
+    sys.exit(1 if any(v in ("failed", "blocked") for v in state.values()) else 0)
@@ -0,0 +1,31 @@
+import os
+import sys
+import resource
+
+try:
+    import psutil
+except ImportError:  # optional: pip install psutil (current RSS on macOS)
+    psutil = None
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_mb():
+    """Current resident memory of this process in MB
+
+    Read from /proc/self/statm on Linux, else psutil. Without either (macOS
+    without psutil) this falls back to the peak RSS, which only grows.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 ** 2
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    return peak_rss_mb()
+
+def peak_rss_mb():
+    """Highest resident memory of this process so far in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
@@ -1,14 +1,81 @@
 import os
 import glob
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def merge_txt_files_from_folders(folder_paths, output_file):
+# OCR_sentence_segmentation.py 写入的文件头信息，合并时跳过
+HEADER_PREFIXES = ('# 文件：', '# 提取方法：', '# 句子数量：')
+
+# 读取块大小和输出缓冲区大小
+READ_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+
+def read_filtered(file_path, chunk_size=READ_CHUNK_SIZE):
+    """分块读取一个txt文件，去掉文件头信息和空行
+
+    Returns:
+        (过滤后的文本, 行数)，每行以换行符结尾
+    """
+    kept = []
+    carry = ''
+    with open(file_path, 'r', encoding='utf-8', buffering=chunk_size) as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), ''):
+            lines = (carry + chunk).split('\n')
+            carry = lines.pop()
+            kept.extend(line for line in map(str.strip, lines)
+                        if line and not line.startswith(HEADER_PREFIXES))
+    carry = carry.strip()
+    if carry and not carry.startswith(HEADER_PREFIXES):
+        kept.append(carry)
+    if not kept:
+        return '', 0
+    return '\n'.join(kept) + '\n', len(kept)
+
+def iter_filtered_files(file_paths, workers=4):
+    """在线程池中预读并过滤文件，按原顺序产出 (路径, 文本, 行数, 错误)
+
+    同时在途的文件最多 2 * workers 个，内存占用与文件总数无关。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(file_paths)
+        for file_path in paths:
+            pending.append((file_path, pool.submit(read_filtered, file_path)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            file_path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(read_filtered, next_path)))
+            try:
+                text, line_count = future.result()
+            except Exception as e:
+                yield file_path, '', 0, e
+            else:
+                yield file_path, text, line_count, None
+
+class CountingWriter:
+    """带大缓冲区的顺序写出，同时累计写出的行数"""
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.lines = 0
+
+    def write(self, text):
+        self.outfile.write(text)
+        self.lines += text.count('\n')
+
+def merge_txt_files_from_folders(folder_paths, output_file, workers=4):
     """
     合并多个文件夹中的所有txt文件
     
     Args:
         folder_paths: 文件夹路径列表
         output_file: 输出文件路径
+        workers: 预读文件的线程数
     """
     
     all_files = []
@@ -45,20 +112,22 @@ def merge_txt_files_from_folders(folder_paths, output_file):
     print(f"\n📝 准备合并 {len(all_files)} 个文件到 {output_file}")
     
     # 创建输出目录
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     # 合并文件
     try:
-        with open(output_file, 'w', encoding='utf-8') as outfile:
+        with open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            outfile = CountingWriter(f)
             # 写入文件头信息
             outfile.write("# 合并的TXT文件\n")
             outfile.write(f"# 总文件数: {len(all_files)}\n")
             outfile.write(f"# 来源文件夹: {', '.join([os.path.basename(fp) for fp in folder_paths])}\n\n")
             
             current_folder = None
+            contents = iter_filtered_files([file_info['path'] for file_info in all_files], workers)
             
-            for file_info in all_files:
-                file_path = file_info['path']
+            for file_info, (_, text, _, error) in zip(all_files, contents):
                 folder_name = file_info['folder']
                 filename = file_info['filename']
                 
@@ -72,49 +141,30 @@ def merge_txt_files_from_folders(folder_paths, output_file):
                 # 添加文件分隔符
                 outfile.write(f"### 文件: {filename}\n\n")
                 
-                # 读取并写入文件内容
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
-                        
-                        # 过滤掉文件头信息和空行
-                        filtered_lines = []
-                        for line in lines:
-                            line = line.strip()
-                            # 跳过文件头信息和空行
-                            if (line and 
-                                not line.startswith('# 文件：') and 
-                                not line.startswith('# 提取方法：') and 
-                                not line.startswith('# 句子数量：')):
-                                filtered_lines.append(line)
-                        
-                        if filtered_lines:
-                            for line in filtered_lines:
-                                outfile.write(line + "\n")
-                    
+                # 写入过滤后的文件内容
+                if error is None:
+                    outfile.write(text)
                     print(f"✅ 已合并: {filename}")
-                    
-                except Exception as e:
-                    print(f"❌ 读取文件失败 {filename}: {e}")
+                else:
+                    print(f"❌ 读取文件失败 {filename}: {error}")
                     outfile.write(f"[错误: 无法读取文件 {filename}]\n\n")
         
         print(f"\n🎉 合并完成! 输出文件: {output_file}")
         
-        # 显示统计信息
-        with open(output_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            print(f"📊 合并后文件行数: {len(lines)}")
+        # 显示统计信息（写出时累计，无需重新读取输出文件）
+        print(f"📊 合并后文件行数: {outfile.lines}")
             
     except Exception as e:
         print(f"❌ 合并失败: {e}")
 
-def merge_txt_files_simple(folder_paths, output_file):
+def merge_txt_files_simple(folder_paths, output_file, workers=4):
     """
     简单合并模式：只合并内容，不添加分隔符和标题
     
     Args:
         folder_paths: 文件夹路径列表
         output_file: 输出文件路径
+        workers: 预读文件的线程数
     """
     
     all_files = []
@@ -141,32 +191,23 @@ def merge_txt_files_simple(folder_paths, output_file):
     print(f"\n📝 准备简单合并 {len(all_files)} 个文件到 {output_file}")
     
     # 创建输出目录
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     # 合并文件
     try:
-        with open(output_file, 'w', encoding='utf-8') as outfile:
-            for file_path in all_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
-                        
-                        # 过滤掉文件头信息和空行
-                        for line in lines:
-                            line = line.strip()
-                            # 跳过文件头信息和空行
-                            if (line and 
-                                not line.startswith('# 文件：') and 
-                                not line.startswith('# 提取方法：') and 
-                                not line.startswith('# 句子数量：')):
-                                outfile.write(line + "\n")
-                    
+        sentence_count = 0
+        with open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as outfile:
+            for file_path, text, line_count, error in iter_filtered_files(all_files, workers):
+                if error is None:
+                    outfile.write(text)
+                    sentence_count += line_count
                     print(f"✅ 已合并: {os.path.basename(file_path)}")
-                    
-                except Exception as e:
-                    print(f"❌ 读取文件失败 {os.path.basename(file_path)}: {e}")
+                else:
+                    print(f"❌ 读取文件失败 {os.path.basename(file_path)}: {error}")
         
         print(f"\n🎉 简单合并完成! 输出文件: {output_file}")
+        print(f"📊 合并后句子数: {sentence_count}")
         
     except Exception as e:
         print(f"❌ 合并失败: {e}")
@@ -186,16 +227,15 @@ if __name__ == "__main__":
     output_file = os.path.join(base_path, "merged_alpine_journal_2020-2022.txt")
     output_file_simple = os.path.join(base_path, "merged_alpine_journal_2020-2022_simple.txt")
     
-    print("选择合并模式:")
-    print("1. 详细模式 (包含文件夹和文件名分隔符)")
-    print("2. 简单模式 (只合并内容)")
-    
-    choice = input("请输入选择 (1 或 2): ").strip()
+    parser = argparse.ArgumentParser(description="合并多个文件夹中的句子txt文件")
+    parser.add_argument("--mode", choices=["detailed", "simple"], default="detailed",
+                        help="detailed: 包含文件夹和文件名分隔符；simple: 只合并内容")
+    parser.add_argument("--folders", nargs="+", default=folder_paths, help="输入文件夹")
+    parser.add_argument("--output", default=None, help="输出文件路径（默认按模式选择）")
+    parser.add_argument("--workers", type=int, default=4, help="预读文件的线程数")
+    args = parser.parse_args()
     
-    if choice == "1":
-        merge_txt_files_from_folders(folder_paths, output_file)
-    elif choice == "2":
-        merge_txt_files_simple(folder_paths, output_file_simple)
+    if args.mode == "simple":
+        merge_txt_files_simple(args.folders, args.output or output_file_simple, args.workers)
     else:
-        print("无效选择，使用详细模式")
-        merge_txt_files_from_folders(folder_paths, output_file)
\ No newline at end of file
+        merge_txt_files_from_folders(args.folders, args.output or output_file, args.workers)
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import argparse
+import spacy
+from spacy.language import Language
+from spacy.util import load_config
+from annotation_records import iter_tasks
+
+# Annotations set upstream that change what ner predicts: it never predicts an
+# entity across a sentence boundary and keeps entities that are already set
+NER_INPUT_ATTRS = {"token.is_sent_start", "doc.sents", "doc.ents"}
+
+def ner_components(model_path):
+    """(kept, dropped) component names of a pipeline, from its config.cfg
+
+    Kept are the components the NER output depends on: ner itself, every
+    component before it that sets sentence boundaries or entities (in the
+    model_0x pipelines the parser), and any tok2vec those listen to.
+    Components with an unknown factory are kept.
+    """
+    config = load_config(os.path.join(model_path, "config.cfg"))
+    pipeline = config["nlp"]["pipeline"]
+    components = config["components"]
+    keep = {"ner"}
+    for name in pipeline[:pipeline.index("ner")]:
+        try:
+            assigns = set(Language.get_factory_meta(components[name]["factory"]).assigns)
+        except (KeyError, ValueError):
+            assigns = NER_INPUT_ATTRS
+        if assigns & NER_INPUT_ATTRS:
+            keep.add(name)
+    for name in list(keep):
+        upstream = components[name].get("model", {}).get("tok2vec", {}).get("upstream")
+        if upstream == "*":
+            keep.update(n for n in pipeline if components[n].get("factory") in ("tok2vec", "transformer"))
+        elif upstream:
+            keep.add(upstream)
+    return [name for name in pipeline if name in keep], [name for name in pipeline if name not in keep]
+
+def load_ner_pipeline(model_path):
+    """Load a trained pipeline without the components NER doesn't use"""
+    return spacy.load(model_path, exclude=ner_components(model_path)[1])
+
+def model_name(model_path):
+    """Short name for a pipeline directory: model_04/model-best -> model_04"""
+    path = os.path.normpath(os.path.abspath(model_path))
+    if os.path.basename(path) in ("model-best", "model-last"):
+        path = os.path.dirname(path)
+    return os.path.basename(path)
+
+def model_names(model_paths):
+    """Unique short names for several pipelines, in order
+
+    model_name, except where two paths share it (model_04/model-best and
+    model_04/model-last): those keep their last two path parts, or the whole
+    path if that still clashes. A ValueError is raised for a path given twice.
+    """
+    paths = [os.path.normpath(os.path.abspath(p)) for p in model_paths]
+    repeated = sorted({p for p in paths if paths.count(p) > 1})
+    if repeated:
+        raise ValueError(f"Pipeline given more than once: {', '.join(repeated)}")
+    names = [model_name(p) for p in paths]
+    names = [name if names.count(name) == 1 else "/".join(path.split(os.sep)[-2:])
+             for name, path in zip(names, paths)]
+    return [name if names.count(name) == 1 else path for name, path in zip(names, paths)]
+
+def read_records(input_path):
+    """Stream (text, meta) pairs from a sentence file or a JSONL file with a "text" field"""
+    if str(input_path).endswith('.jsonl'):
+        for task in iter_tasks(input_path):
+            yield task.text, task.meta
+        return
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line, {}
+
+def doc_to_task(doc, source=None, meta=None):
+    """Convert a processed Doc into a Prodigy-style task with tokens and entity spans"""
+    tokens = [{
+        "text": token.text,
+        "start": token.idx,
+        "end": token.idx + len(token.text),
+        "id": token.i,
+        "ws": bool(token.whitespace_)
+    } for token in doc]
+
+    spans = []
+    for ent in doc.ents:
+        span = {
+            "token_start": ent.start,
+            "token_end": ent.end - 1,
+            "start": ent.start_char,
+            "end": ent.end_char,
+            "text": ent.text,
+            "label": ent.label_
+        }
+        if source:
+            span["source"] = source
+        spans.append(span)
+
+    task = {"text": doc.text, "tokens": tokens, "spans": spans}
+    if meta:
+        task["meta"] = meta
+    return task
+
+def run_inference(model_path, input_path, output_path, batch_size=256, n_process=1):
+    """Run NER over every record in input_path and write Prodigy-style JSONL"""
+    start = time.time()
+    nlp = load_ner_pipeline(model_path)
+    print(f"Loaded {model_path} ({', '.join(nlp.pipe_names)}) in {time.time() - start:.1f}s")
+
+    source = model_name(model_path)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    doc_count = 0
+    ent_count = 0
+    start = time.time()
+    with open(output_path, 'w', encoding='utf-8') as out:
+        docs = nlp.pipe(read_records(input_path), as_tuples=True,
+                        batch_size=batch_size, n_process=n_process)
+        for doc, meta in docs:
+            out.write(json.dumps(doc_to_task(doc, source, meta), ensure_ascii=False) + "\n")
+            doc_count += 1
+            ent_count += len(doc.ents)
+
+    elapsed = time.time() - start
+    rate = doc_count / elapsed if elapsed else 0
+    print(f"Processed {doc_count} texts, {ent_count} entities in {elapsed:.1f}s ({rate:.0f} texts/s)")
+    return doc_count, ent_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched NER inference with a trained model_0x pipeline")
+    parser.add_argument("model", help="Pipeline directory, e.g. model_04/model-best")
+    parser.add_argument("input", help="Sentence file (one per line) or JSONL with a \"text\" field")
+    parser.add_argument("output", help="Output JSONL with Prodigy-style tokens and spans")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-process", type=int, default=1)
+    args = parser.parse_args()
+
+    run_inference(args.model, args.input, args.output,
+                  batch_size=args.batch_size, n_process=args.n_process)
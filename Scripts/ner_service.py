@@ -0,0 +1,265 @@
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from ner_inference import load_ner_pipeline, model_name, model_names
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 10
+LATENCY_WINDOW = 10000  # most recent requests kept for the latency percentiles
+DEFAULT_PORT = 8090  # Prodigy uses 8080
+
+# ---------- Worker processes ----------
+
+_worker_nlp = None
+
+def _init_worker(model_path):
+    global _worker_nlp
+    _worker_nlp = load_ner_pipeline(model_path)
+
+def _annotate(texts):
+    """Entity spans for a batch of texts (runs in a worker process)"""
+    results = []
+    for doc in _worker_nlp.pipe(texts, batch_size=len(texts)):
+        results.append([{"start": ent.start_char, "end": ent.end_char, "text": ent.text, "label": ent.label_,
+                         "token_start": ent.start, "token_end": ent.end - 1} for ent in doc.ents])
+    return results
+
+# ---------- Micro-batching ----------
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+class ModelService:
+    """One pipeline behind a request queue, a batcher thread and a pool of worker processes
+
+    The batcher takes the oldest queued text and keeps adding texts until the
+    batch has max_batch_size texts or the oldest one has waited max_wait_ms.
+    It then waits for a free worker, so while all workers are busy the queue
+    grows and the next batch is bigger: single-sentence callers get batched
+    throughput under load and at most max_wait_ms extra latency when idle.
+    """
+
+    def __init__(self, model_path, workers=1, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name=None):
+        self.name = name or model_name(model_path)
+        self.model_path = model_path
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.free_workers = threading.Semaphore(workers)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # seconds from enqueue to result, per text
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"texts": 0, "batches": 0, "errors": 0, "in_flight_batches": 0}
+
+        start = time.time()
+        # spawn: the server is multi-threaded, so forking it is not safe
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(model_path,))
+        # Load the model in every worker now rather than on the first request
+        for future in [self.pool.submit(_annotate, [""]) for _ in range(workers)]:
+            future.result()
+        print(f"Loaded {self.name} in {workers} worker(s) in {time.time() - start:.1f}s")
+        self.thread = threading.Thread(target=self._batch_loop, name=f"batcher-{self.name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, text):
+        """Queue one text; the Future resolves to its list of entity spans"""
+        future = Future()
+        self.queue.put((text, future, time.monotonic()))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first[2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+
+            self.free_workers.acquire()
+            with self.lock:
+                self.counts["in_flight_batches"] += 1
+            try:
+                future = self.pool.submit(_annotate, [text for text, _, _ in batch])
+            except RuntimeError as e:  # pool shut down
+                self._finish(batch, None, e)
+                continue
+            future.add_done_callback(lambda done, batch=batch: self._finish(batch, done))
+
+    def _finish(self, batch, done, error=None):
+        if done is not None:
+            error = done.exception()
+        now = time.monotonic()
+        with self.lock:
+            self.counts["in_flight_batches"] -= 1
+            self.counts["batches"] += 1
+            self.counts["texts"] += len(batch)
+            self.batch_sizes.append(len(batch))
+            if error is not None:
+                self.counts["errors"] += 1
+            else:
+                self.latencies.extend(now - enqueued for _, _, enqueued in batch)
+        self.free_workers.release()
+        if error is not None:
+            for _, future, _ in batch:
+                future.set_exception(error)
+        else:
+            for (_, future, _), spans in zip(batch, done.result()):
+                future.set_result(spans)
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            batch_sizes = list(self.batch_sizes)
+            counts = dict(self.counts)
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue.qsize(),
+            **counts,
+            "mean_batch_size": sum(batch_sizes) / len(batch_sizes) if batch_sizes else None,
+            "latency_ms": {f"p{q}": None if not latencies else round(percentile(latencies, q) * 1000, 2)
+                           for q in (50, 90, 99)},
+        }
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.pool.shutdown()
+
+# ---------- HTTP ----------
+
+class NERRequestHandler(BaseHTTPRequestHandler):
+    """POST /ner  {"text": ...} or {"texts": [...]}, optional "model"
+    GET /metrics, /models, /health
+    """
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        services = self.server.services
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send(200, {"uptime_s": round(time.time() - self.server.started, 1),
+                             "models": {name: service.metrics() for name, service in services.items()}})
+        elif path == "/models":
+            self._send(200, {"default": self.server.default_model,
+                             "models": {name: {"path": service.model_path, "workers": service.workers}
+                                        for name, service in services.items()}})
+        elif path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/ner":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(request, dict):
+            self._send(400, {"error": "Expected a JSON object"})
+            return
+
+        name = request.get("model") or self.server.default_model
+        service = self.server.services.get(name)
+        if service is None:
+            self._send(404, {"error": f"Unknown model {name!r}", "models": list(self.server.services)})
+            return
+        single = "texts" not in request
+        texts = [request.get("text")] if single else request["texts"]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            self._send(400, {"error": "Expected \"text\": string or \"texts\": [string, ...]"})
+            return
+
+        futures = [service.submit(text) for text in texts]
+        try:
+            results = [{"text": text, "spans": future.result()} for text, future in zip(texts, futures)]
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, dict(results[0], model=name) if single else {"model": name, "results": results})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(model_paths, host="127.0.0.1", port=DEFAULT_PORT, workers=1, max_batch_size=MAX_BATCH_SIZE,
+          max_wait_ms=MAX_WAIT_MS, verbose=False):
+    try:
+        names = model_names(model_paths)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    services = {}
+    for model_path, name in zip(model_paths, names):
+        services[name] = ModelService(model_path, workers, max_batch_size, max_wait_ms, name)
+
+    server = ThreadingHTTPServer((host, port), NERRequestHandler)
+    server.daemon_threads = True
+    server.services = services
+    server.default_model = next(iter(services))
+    server.started = time.time()
+    server.verbose = verbose
+    print(f"Serving {', '.join(services)} on http://{host}:{port} "
+          f"(batches of up to {max_batch_size}, {max_wait_ms} ms max wait)")
+    # Stop the same way on SIGTERM (service managers, kill) as on Ctrl+C
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A second SIGTERM must not interrupt closing the worker pools
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        server.server_close()
+        for service in services.values():
+            service.close()
+        print("Stopped")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running NER service with dynamic micro-batching")
+    parser.add_argument("--model", nargs="+", required=True,
+                        help="Pipeline directories, e.g. model_04/model-best (the first is the default)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes per model")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="Texts per nlp.pipe batch")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="Longest a text waits for its batch to fill")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    serve(args.model, args.host, args.port, args.workers, args.max_batch_size, args.max_wait_ms, args.verbose)
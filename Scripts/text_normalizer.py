@@ -0,0 +1,191 @@
+import os
+import re
+import sys
+import random
+import argparse
+
+# 连字符规则：先去掉连字符后的空白，再一次性处理两侧都是小写字母的连字符
+# （原来的 "Zimmer- man" 和 "west-ern" 两条规则）。以字面量 "-" 开头便于快速定位。
+_HYPHEN_SPACE = re.compile(r'-\s+')
+_HYPHEN_BETWEEN_LOWER = re.compile(r'-(?=[a-z])(?<=[a-z]-)')
+
+# 单字母分割合并：三条规则按共同前缀合并为一个正则，
+# 贪婪的可选分组保持原来 5 -> 4 -> 3 的优先顺序
+_SPLIT_LETTERS = re.compile(
+    r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])(?:\s([a-zA-Z])(?:\s([a-zA-Z]+))?)?\b')
+
+# 空白压缩与特殊字符替换（两类字符互不相交，可一次完成）；
+# 单个普通空格本来就是结果，不作为匹配，减少替换次数
+_SPACES_AND_SYMBOLS = re.compile(r'[^\S ]\s*| \s+|[^\w\s\.\,\!\?\;\:\-\(\)\[\]\"\']+')
+
+# 流式处理的安全切分点（切在空白串之后）：空白串前不是连字符，并且空白串长度
+# 至少为 2，或者一侧不是字母。连字符规则不会跨过这样的空白，单字母规则只跨过
+# 两侧都是字母的单个空白字符，因此两侧分别处理后拼接与整体处理结果相同。
+_SAFE_SPLIT = re.compile(
+    r'(?<=[^\s-])(?:\s{2,}|(?<=[^\sA-Za-z-])\s|\s(?=[^\sA-Za-z]))(?=\S)')
+
+# clean_text 丢弃不超过该长度的结果
+_MIN_LENGTH = 10
+
+def clean_text_reference(text):
+    """clean_text 的原始逐条正则实现，作为黄金输出的基准"""
+    text = re.sub(r'-\s+', '-', text)
+    text = re.sub(r'([A-Z][a-z]+)-\s*([a-z]+)', r'\1\2', text)
+    text = re.sub(r'([a-z])-([a-z])', r'\1\2', text)
+    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z]+)\b', r'\1\2\3\4\5', text)
+    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\b', r'\1\2\3\4', text)
+    text = re.sub(r'\b([a-zA-Z])\s([a-zA-Z])\s([a-zA-Z])\b', r'\1\2\3', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\"\']+', ' ', text)
+    lines = text.split('\n')
+    cleaned_lines = [line.strip() for line in lines if len(line.strip()) > 10]
+    return '\n'.join(cleaned_lines)
+
+def _fix_hyphens(text):
+    """等价于依次执行原来的三条连字符规则"""
+    text = _HYPHEN_SPACE.sub('-', text)
+    last_joined = -3  # 上一个按 "west-ern" 规则去掉的连字符位置
+
+    def fix(match):
+        nonlocal last_joined
+        position = match.start()
+        i = position - 1
+        while i >= 0 and 'a' <= text[i] <= 'z':
+            i -= 1
+        if i >= 0 and 'A' <= text[i] <= 'Z':
+            # "Zimmer-man"：大写字母开头的单词
+            return ''
+        if position - last_joined == 2:
+            # 中间的单个字母已被上一次匹配消耗（"a-b-c" -> "ab-c"）
+            return '-'
+        last_joined = position
+        return ''
+
+    return _HYPHEN_BETWEEN_LOWER.sub(fix, text)
+
+def _join_letters(match):
+    return ''.join(group for group in match.groups() if group)
+
+def _normalize_segment(text):
+    """对一段文本执行全部规则，不做首尾 strip 和长度过滤"""
+    if '-' in text:
+        text = _fix_hyphens(text)
+    text = _SPLIT_LETTERS.sub(_join_letters, text)
+    return _SPACES_AND_SYMBOLS.sub(' ', text)
+
+def normalize_text(text):
+    """用预编译的合并规则执行 clean_text，输出与 clean_text_reference 完全一致"""
+    text = _normalize_segment(text).strip()
+    return text if len(text) > _MIN_LENGTH else ''
+
+def _last_safe_split(text, window=512):
+    """返回最后一个安全切分点，没有则返回 0；从末尾开始按倍增窗口查找"""
+    start = len(text)
+    while start > 0:
+        start = max(0, start - window)
+        split = 0
+        for match in _SAFE_SPLIT.finditer(text, start):
+            split = match.end()
+        if split:
+            return split
+        window *= 2
+    return 0
+
+def normalize_stream(chunks):
+    """逐块（如逐页）规范化文本
+
+    依次产出的片段拼接后等于 normalize_text(''.join(chunks))；
+    缓冲区只保留最后一个安全切分点之后的内容。
+    """
+    buffer = ''
+    pending = ''  # 尚未确定是否位于结尾的空白
+    held = ''  # 总长度还没超过 _MIN_LENGTH 时暂存的输出
+    started = False
+
+    def emit(segment):
+        nonlocal pending, held, started
+        if not started and not held:
+            segment = segment.lstrip()
+            if not segment:
+                return
+        body = segment.rstrip()
+        if not body:
+            pending += segment
+            return
+        out = pending + segment[:len(body)]
+        pending = segment[len(body):]
+        if not started:
+            held += out
+            if len(held) <= _MIN_LENGTH:
+                return
+            out, held = held, ''
+            started = True
+        yield out
+
+    for chunk in chunks:
+        buffer += chunk
+        split = _last_safe_split(buffer)
+        if split:
+            yield from emit(_normalize_segment(buffer[:split]))
+            buffer = buffer[split:]
+    yield from emit(_normalize_segment(buffer))
+
+def _golden_corpus(annotation_dir, seed=13, fuzz_cases=20000):
+    """黄金输出语料：标注集中的句子、典型OCR问题样例以及固定种子生成的随机文本"""
+    corpus = [
+        "self- contained west-ern Zimmer- man",
+        "h e l l o world and a special time",
+        "T h e A l p i n e J o u r n a l",
+        "--- Page 12 ---\nThe Eiger's north- face (3967 m) — climbed © 1938.",
+        "McDonald-son and Schmid-brothers on the Matter- horn",
+        "a-b-c-d e-f  g h i\n\nj k l m nopq",
+        "short",
+    ]
+    if annotation_dir and os.path.isdir(annotation_dir):
+        # 只有 --check 需要读标注，clean_text 的导入不依赖记录层
+        from annotation_records import iter_tasks
+        for filename in sorted(os.listdir(annotation_dir)):
+            if filename.endswith('.jsonl'):
+                tasks = iter_tasks(os.path.join(annotation_dir, filename))
+                corpus.append('\n'.join(task.text for task in tasks))
+
+    rng = random.Random(seed)
+    alphabet = list("aaabcdeAB  \n\t-_1.,©é\xa0")
+    for _ in range(fuzz_cases):
+        corpus.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))))
+    return corpus
+
+def check_golden(corpus, seed=13):
+    """整体和随机分块流式两种方式都必须与基准输出一致，返回不一致的样例"""
+    rng = random.Random(seed)
+    failures = []
+    for text in corpus:
+        expected = clean_text_reference(text)
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, 4)))
+        chunks = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        if normalize_text(text) != expected or ''.join(normalize_stream(chunks)) != expected:
+            failures.append(text)
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="clean_text 规范化引擎")
+    parser.add_argument("--check", action="store_true", help="与原始 clean_text 对比黄金输出")
+    parser.add_argument("--annotations", default=os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Checked_Annotations"),
+                        help="加入黄金语料的标注目录")
+    parser.add_argument("files", nargs="*", help="需要规范化的文本文件（逐块读取）")
+    args = parser.parse_args()
+
+    if args.check:
+        corpus = _golden_corpus(args.annotations)
+        failures = check_golden(corpus)
+        for text in failures[:10]:
+            print(f"❌ 输出不一致：{text[:80]!r}")
+        print(f"{'✅' if not failures else '❌'} 黄金语料 {len(corpus)} 条，不一致 {len(failures)} 条")
+        sys.exit(1 if failures else 0)
+
+    for path in args.files:
+        with open(path, 'r', encoding='utf-8') as f:
+            for piece in normalize_stream(iter(lambda: f.read(1024 * 1024), '')):
+                sys.stdout.write(piece)
+        sys.stdout.write('\n')
@@ -0,0 +1,7 @@
+# Thread pools that numpy / thinc backends size from the environment
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+def thread_env(threads):
+    """Environment variables capping those pools at `threads` threads, for a child process"""
+    return {name: str(threads) for name in THREAD_ENV_VARS}
@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import hashlib
+import argparse
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import spacy
+from spacy.tokens import DocBin
+from spacy.util import load_config
+from evaluate_models import gold_docs_from_jsonl
+from thread_env import thread_env
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANNOTATIONS = os.path.join(PROJECT_DIR, "Checked_Annotations")
+DEFAULT_CONFIG = os.path.join(PROJECT_DIR, "model_04", "model-best", "config.cfg")
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, "experiments")
+
+LEARNING_CURVE = (0.25, 0.5, 0.75, 1.0)
+# "  E    #       LOSS NER  ENTS_F ..." rows of spaCy's console logger: epoch, step
+LOG_ROW = re.compile(r'^\s*(\d+)\s+(\d+)\s')
+
+def load_gold(jsonl_paths):
+    """Accepted docs from every file, one per sentence (a later file overrides an earlier one)
+
+    The checked sets overlap (e.g. 2301_Latest contains 1060_Latest), so
+    without this a sentence could land in both train and dev of a fold.
+    """
+    vocab = spacy.blank("en").vocab
+    docs = {}
+    for jsonl_path in jsonl_paths:
+        for doc in gold_docs_from_jsonl(jsonl_path, vocab):
+            docs[" ".join(doc.text.split())] = doc
+    return list(docs.values())
+
+def _save(docs, path):
+    doc_bin = DocBin(attrs=["ORTH", "SPACY", "ENT_IOB", "ENT_TYPE"])
+    for doc in docs:
+        doc_bin.add(doc)
+    doc_bin.to_disk(path)
+
+def build_splits(jsonl_paths, split_root, folds=5, curve=LEARNING_CURVE, seed=0):
+    """Write the train/dev DocBins of every run once; return the run list
+
+    k-fold: the shuffled docs are dealt into `folds` dev sets, each run
+    trains on the rest. Learning curve: fold 0's dev set is held out and
+    the runs train on the first 25/50/75/100% of fold 0's training docs
+    (nested subsets). Splits are keyed by the input files' contents and
+    the parameters, so repeated experiments reuse them.
+    """
+    digest = hashlib.sha1(json.dumps([folds, list(curve), seed]).encode('utf-8'))
+    for jsonl_path in jsonl_paths:
+        with open(jsonl_path, 'rb') as f:
+            digest.update(f.read())
+    split_dir = os.path.join(split_root, digest.hexdigest()[:12])
+    manifest_path = os.path.join(split_dir, "runs.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            runs = json.load(f)
+        print(f"Reusing splits in {split_dir}")
+        return runs
+
+    docs = load_gold(jsonl_paths)
+    order = list(range(len(docs)))
+    random.Random(seed).shuffle(order)
+    os.makedirs(split_dir, exist_ok=True)
+    runs = []
+    dev_sets = [order[fold::folds] for fold in range(folds)]
+    for fold, dev in enumerate(dev_sets):
+        held_out = set(dev)
+        train = [i for i in order if i not in held_out]
+        dev_path = os.path.join(split_dir, f"fold{fold}-dev.spacy")
+        train_path = os.path.join(split_dir, f"fold{fold}-train.spacy")
+        _save([docs[i] for i in dev], dev_path)
+        _save([docs[i] for i in train], train_path)
+        runs.append({"name": f"fold{fold}", "experiment": "kfold", "fold": fold,
+                     "train": train_path, "dev": dev_path, "train_docs": len(train), "dev_docs": len(dev)})
+
+        if fold == 0:
+            for fraction in curve:
+                subset = train[:max(1, round(len(train) * fraction))]
+                subset_path = train_path if len(subset) == len(train) else \
+                    os.path.join(split_dir, f"curve{int(fraction * 100)}-train.spacy")
+                if subset_path != train_path:
+                    _save([docs[i] for i in subset], subset_path)
+                runs.append({"name": f"curve{int(fraction * 100)}", "experiment": "curve", "fraction": fraction,
+                             "train": subset_path, "dev": dev_path,
+                             "train_docs": len(subset), "dev_docs": len(dev)})
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, indent=2)
+    print(f"Wrote splits for {len(docs)} docs to {split_dir}")
+    return runs
+
+def training_config(base_config, patience=1600, eval_frequency=200, max_steps=20000):
+    """NER-only spaCy config from a prodigy-trained model's config.cfg
+
+    The frozen tagger/parser/lemmatizer are dropped (a shared tok2vec is kept
+    if ner listens to it), the prodigy corpus readers and logger are replaced
+    by spaCy's own, and training stops after `patience` steps without a dev
+    improvement instead of running the whole step budget.
+    """
+    config = load_config(base_config)
+    listens = "Listener" in config["components"]["ner"]["model"]["tok2vec"].get("@architectures", "")
+    pipeline = [name for name in config["nlp"]["pipeline"] if name == "ner" or (listens and name == "tok2vec")]
+    config["nlp"]["pipeline"] = pipeline
+    config["nlp"]["disabled"] = []
+    config["components"] = {name: config["components"][name] for name in pipeline}
+    config["initialize"]["components"] = {name: value for name, value in
+                                          config["initialize"].get("components", {}).items() if name in pipeline}
+    corpus = {"@readers": "spacy.Corpus.v1", "max_length": 0, "gold_preproc": False, "limit": 0, "augmenter": None}
+    config["corpora"] = {"train": dict(corpus, path="${paths.train}"), "dev": dict(corpus, path="${paths.dev}")}
+    config["training"].update(train_corpus="corpora.train", dev_corpus="corpora.dev",
+                              frozen_components=[], annotating_components=[],
+                              patience=patience, eval_frequency=eval_frequency, max_steps=max_steps)
+    config["training"]["logger"] = {"@loggers": "spacy.ConsoleLogger.v1", "progress_bar": False}
+    config["training"]["score_weights"] = {"ents_f": 1.0, "ents_p": 0.0, "ents_r": 0.0, "ents_per_type": None}
+    return config
+
+def run_training(run, config_path, output_dir, threads=1, seed=0):
+    """Train one run with `spacy train` in a subprocess limited to `threads` threads"""
+    run_dir = os.path.join(output_dir, run["name"])
+    os.makedirs(run_dir, exist_ok=True)
+    env = dict(os.environ, **thread_env(threads))
+    command = [sys.executable, "-m", "spacy", "train", config_path, "--output", run_dir,
+               "--paths.train", run["train"], "--paths.dev", run["dev"], "--system.seed", str(seed)]
+    start = time.time()
+    with open(os.path.join(run_dir, "train.log"), 'w', encoding='utf-8') as log:
+        returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, env=env).returncode
+    result = dict(run, seconds=round(time.time() - start, 1), returncode=returncode)
+
+    steps = 0
+    with open(os.path.join(run_dir, "train.log"), 'r', encoding='utf-8') as log:
+        for line in log:
+            row = LOG_ROW.match(line)
+            if row:
+                steps = int(row.group(2))
+    result["steps"] = steps
+
+    meta_path = os.path.join(run_dir, "model-best", "meta.json")
+    if returncode == 0 and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            performance = json.load(f).get("performance", {})
+        result.update({key: performance.get(key) for key in ("ents_p", "ents_r", "ents_f")})
+        result["ents_per_type"] = performance.get("ents_per_type") or {}
+    return result
+
+def _mean_std(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "-"
+    if len(values) == 1:
+        return f"{values[0]:.3f}"
+    return f"{statistics.mean(values):.3f} ± {statistics.stdev(values):.3f}"
+
+def format_report(results):
+    """Markdown report: every run, then k-fold mean ± std and the learning curve"""
+    lines = ["# Training experiments", "", "| run | train | dev | P | R | F | steps | time (s) |",
+             "|---|---|---|---|---|---|---|---|"]
+    for r in results:
+        if r.get("ents_f") is None:
+            lines.append(f"| {r['name']} | {r['train_docs']} | {r['dev_docs']} | failed (exit {r['returncode']}) "
+                         f"| | | {r['steps']} | {r['seconds']} |")
+        else:
+            lines.append(f"| {r['name']} | {r['train_docs']} | {r['dev_docs']} | {r['ents_p']:.3f} | "
+                         f"{r['ents_r']:.3f} | {r['ents_f']:.3f} | {r['steps']} | {r['seconds']} |")
+
+    kfold = [r for r in results if r["experiment"] == "kfold"]
+    if kfold:
+        lines += ["", f"## {len(kfold)}-fold cross-validation", "",
+                  f"- P: {_mean_std([r.get('ents_p') for r in kfold])}",
+                  f"- R: {_mean_std([r.get('ents_r') for r in kfold])}",
+                  f"- F: {_mean_std([r.get('ents_f') for r in kfold])}"]
+        labels = sorted({label for r in kfold for label in r.get("ents_per_type", {})})
+        if labels:
+            lines += ["", "| label | F (mean ± std) |", "|---|---|"]
+            for label in labels:
+                values = [r["ents_per_type"][label]["f"] for r in kfold if label in r.get("ents_per_type", {})]
+                lines.append(f"| {label} | {_mean_std(values)} |")
+
+    curve = sorted((r for r in results if r["experiment"] == "curve"), key=lambda r: r["fraction"])
+    if curve:
+        lines += ["", "## Learning curve (fold 0 dev set)", "", "| data | train docs | F |", "|---|---|---|"]
+        for r in curve:
+            score = "-" if r.get("ents_f") is None else f"{r['ents_f']:.3f}"
+            lines.append(f"| {r['fraction']:.0%} | {r['train_docs']} | {score} |")
+
+    lines += ["", f"Total training time: {sum(r['seconds'] for r in results):.0f}s across {len(results)} runs"]
+    return "\n".join(lines) + "\n"
+
+def run_experiments(jsonl_paths, base_config, output_dir, experiments=("kfold", "curve"), folds=5,
+                    curve=LEARNING_CURVE, jobs=None, threads=1, patience=1600, eval_frequency=200,
+                    max_steps=20000, seed=0):
+    """Build the splits, train every run in parallel and write results.json and report.md"""
+    all_runs = build_splits(jsonl_paths, os.path.join(output_dir, "splits"), folds, curve, seed)
+    runs = [run for run in all_runs if run["experiment"] in experiments]
+    # curve100 trains on exactly fold 0's data; reuse that run when both experiments are selected
+    if "kfold" in experiments:
+        runs = [run for run in runs if not (run["experiment"] == "curve" and run["fraction"] == 1.0)]
+
+    config_path = os.path.join(output_dir, "config.cfg")
+    training_config(base_config, patience, eval_frequency, max_steps).to_disk(config_path)
+    jobs = jobs or max(1, (os.cpu_count() or 1) // threads)
+    print(f"Training {len(runs)} runs, {jobs} at a time with {threads} thread(s) each")
+
+    results = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_training, run, config_path, output_dir, threads, seed): run for run in runs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            score = "failed" if result.get("ents_f") is None else f"F {result['ents_f']:.3f}"
+            print(f"  {result['name']}: {score}, {result['steps']} steps, {result['seconds']}s")
+    print(f"All runs finished in {time.time() - start:.0f}s")
+
+    if "kfold" in experiments and "curve" in experiments:
+        fold0 = next((r for r in results if r["name"] == "fold0"), None)
+        if fold0 is not None:
+            results.append(dict(fold0, name="curve100", experiment="curve", fraction=1.0))
+    order = {run["name"]: i for i, run in enumerate(all_runs)}
+    results.sort(key=lambda r: order.get(r["name"], len(order)))
+
+    with open(os.path.join(output_dir, "results.json"), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    report = format_report(results)
+    with open(os.path.join(output_dir, "report.md"), 'w', encoding='utf-8') as f:
+        f.write(report)
+    return results, report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel k-fold and learning-curve NER training")
+    parser.add_argument("--datasets", nargs="*",
+                        default=sorted(glob.glob(os.path.join(DEFAULT_ANNOTATIONS, "*.jsonl"))),
+                        help="Gold JSONL files (default: Checked_Annotations/*.jsonl)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Base config (default: model_04's)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Directory for splits, runs and the report")
+    parser.add_argument("--experiments", nargs="+", choices=["kfold", "curve"], default=["kfold", "curve"])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--curve", type=float, nargs="+", default=list(LEARNING_CURVE),
+                        help="Fractions of the training data for the learning curve")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel training processes (default: CPUs / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per training process")
+    parser.add_argument("--patience", type=int, default=1600, help="Stop after this many steps without a dev improvement")
+    parser.add_argument("--eval-frequency", type=int, default=200)
+    parser.add_argument("--max-steps", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    _, report = run_experiments(args.datasets, args.config, args.output, args.experiments, args.folds,
+                                args.curve, args.jobs, args.threads, args.patience, args.eval_frequency,
+                                args.max_steps, args.seed)
+    print("\n" + report)
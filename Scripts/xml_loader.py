@@ -0,0 +1,55 @@
+import gc
+from lxml import etree
+
+def load_text_xml(text_xml):
+    """Stream an _en.xml file once and collect its words and sentences
+
+    Returns (words, sentences):
+      words: {word_id: (text, sentence_index)}, sentence_index is None for
+             <w> elements that are not direct children of an <s>
+      sentences: [(s_id, [word texts])] in document order, including empty ones
+
+    Elements are cleared as soon as they have been read, so the parsed tree
+    never holds more than the current sentence, whatever the size of the volume.
+    """
+    # The cyclic GC keeps rescanning the growing word map while iterparse
+    # allocates an element proxy per event; nothing here creates cycles
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load(text_xml)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _load(text_xml):
+    words = {}
+    sentences = []
+    open_sentences = []  # (element, index) for the <s> elements currently open
+
+    for event, elem in etree.iterparse(text_xml, events=("start", "end"), tag=("s", "w")):
+        if elem.tag == "s":
+            if event == "start":
+                open_sentences.append((elem, len(sentences)))
+                sentences.append((elem.get('id'), []))
+                continue
+            open_sentences.pop()
+        elif event == "end":
+            index = None
+            if open_sentences and elem.getparent() is open_sentences[-1][0]:
+                index = open_sentences[-1][1]
+                sentences[index][1].append(elem.text)
+            words[elem.get('id')] = (elem.text, index)
+            if index is not None:
+                # Still a child of an open <s>; removed when that sentence ends
+                elem.clear(keep_tail=True)
+                continue
+        else:
+            continue
+
+        # Drop the finished element and everything before it
+        elem.clear(keep_tail=True)
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+    return words, sentences
@@ -1,22 +1,41 @@
+import io
 import os
 import re
+import argparse
+from bisect import bisect_right
 from lxml import etree
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from xml_loader import load_text_xml
+
+try:
+    import ahocorasick
+except ImportError:  # optional: pip install pyahocorasick
+    ahocorasick = None
 
 INPUT_DIR = "/Users/liuxduan/Desktop/Prodigy/Cleaned_Alpine_Journal"
 OUTPUT_FILE = os.path.join(INPUT_DIR, "yearly_sentences_annotated.txt")
 
+# Punctuation spacing fixes applied to reconstructed sentences
+PUNCT_AFTER = re.compile(r'\s([,.!?;:](?:\s|$))')
+OPEN_PAREN = re.compile(r'([(])\s')
+CLOSE_PAREN = re.compile(r'\s([)])')
+
+# Joins sentences into one searchable string; cannot occur in XML text or names
+SENTENCE_SEPARATOR = '\x00'
+
 def load_word_mapping(text_xml):
     """Create word ID to text mapping with sentence context"""
-    tree = etree.parse(text_xml)
+    words, sentences = load_text_xml(text_xml)
     word_map = {}
     sentence_map = defaultdict(list)
     
-    for s in tree.xpath('//s'):
-        s_id = s.get('id')
-        for w in s.xpath('./w'):
-            word_map[w.get('id')] = (w.text, s_id)
-            sentence_map[s_id].append(w.text)
+    for wid, (text, index) in words.items():
+        if index is not None:
+            word_map[wid] = (text, sentences[index][0])
+    for s_id, sentence_words in sentences:
+        if sentence_words:
+            sentence_map[s_id].extend(sentence_words)
     
     return word_map, sentence_map
 
@@ -63,51 +82,112 @@ def reconstruct_sentences(sentence_map):
     for s_id, words in sentence_map.items():
         sentence = ' '.join(words)
         # Fix punctuation spacing
-        sentence = re.sub(r'\s([,.!?;:](?:\s|$))', r'\1', sentence)
-        sentence = re.sub(r'([(])\s', r'\1', sentence)
-        sentence = re.sub(r'\s([)])', r'\1', sentence)
+        sentence = PUNCT_AFTER.sub(r'\1', sentence)
+        sentence = OPEN_PAREN.sub(r'\1', sentence)
+        sentence = CLOSE_PAREN.sub(r'\1', sentence)
         formatted_sentences.append((s_id, sentence))
     return formatted_sentences
 
-def match_entities_to_sentences(entities, sentence_map):
-    """Link entities to their containing sentences"""
-    # Convert sentence_map (lists of words) to formatted sentences
-    s_id_to_text = {}
-    for s_id, words in sentence_map.items():
-        sentence = ' '.join(words)
-        # Fix punctuation spacing (same as in reconstruct_sentences)
-        sentence = re.sub(r'\s([,.!?;:](?:\s|$))', r'\1', sentence)
-        sentence = re.sub(r'([(])\s', r'\1', sentence)
-        sentence = re.sub(r'\s([)])', r'\1', sentence)
-        s_id_to_text[s_id] = sentence
-    
+def build_sentence_index(sentences):
+    """Join formatted sentences into one string plus the start offset of each sentence"""
+    offsets = []
+    position = 0
+    for _, text in sentences:
+        offsets.append(position)
+        position += len(text) + len(SENTENCE_SEPARATOR)
+    return SENTENCE_SEPARATOR.join(text for _, text in sentences), offsets
+
+def find_sentences(names, sentences):
+    """Map each name to the IDs of the sentences containing it, in sentence order
+
+    Same result as testing `name in text` for every sentence, but the joined
+    text is scanned once for all names with an Aho-Corasick automaton when
+    pyahocorasick is installed, otherwise once per distinct name with str.find.
+    """
+    corpus, offsets = build_sentence_index(sentences)
+    hits = {name: [] for name in names}
+    if not hits or not sentences:
+        return {name: [] for name in hits}
+
+    def add(name, start):
+        index = bisect_right(offsets, start) - 1
+        found = hits[name]
+        if not found or found[-1] != index:
+            found.append(index)
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for name in hits:
+            automaton.add_word(name, name)
+        automaton.make_automaton()
+        for end, name in automaton.iter(corpus):
+            add(name, end - len(name) + 1)
+    else:
+        for name in hits:
+            start = corpus.find(name)
+            while start != -1:
+                add(name, start)
+                # Skip the rest of this sentence: one hit per sentence is enough
+                next_index = hits[name][-1] + 1
+                if next_index == len(offsets):
+                    break
+                start = corpus.find(name, offsets[next_index])
+
+    return {name: [sentences[i][0] for i in found] for name, found in hits.items()}
+
+def match_entities_to_sentences(entities, sentences):
+    """Link entities to their containing sentences
+
+    sentences are the (s_id, text) pairs from reconstruct_sentences.
+    """
+    s_id_to_text = dict(sentences)
+    # Person entities have no span, so they are located by name
+    unmatched = {entity['text'] for entity in entities if not entity['sentences']}
+    name_sentences = find_sentences(unmatched, sentences)
+
     for entity in entities:
         if not entity['sentences']:  # For person entities without direct span
-            for s_id, text in s_id_to_text.items():
-                if entity['text'] in text:
-                    entity['sentences'].append(s_id)
+            entity['sentences'] = list(name_sentences[entity['text']])
         
         # Convert sentence IDs to sentence texts
         entity['sentence_texts'] = [s_id_to_text[s_id] 
                                    for s_id in entity['sentences'] 
                                    if s_id in s_id_to_text]
 
-def process_year(year_files, output_handle):
-    """Process all files for a single year"""
+def process_pair(text_file, ner_file):
+    """Sentences and linked entities for one (_en.xml, _en-ner.xml) pair"""
+    word_map, sentence_map = load_word_mapping(text_file)
+    entities = extract_entities(ner_file, word_map)
+    sentences = reconstruct_sentences(sentence_map)
+    match_entities_to_sentences(entities, sentences)
+    return sentences, entities
+
+def process_year(year_files, output_handle=None):
+    """Process all files for a single year
+
+    A pair that fails is skipped and returned in errors as (text_file, message).
+    """
     yearly_sentences = []
     yearly_entities = []
+    errors = []
     
     for text_file, ner_file in year_files:
-        word_map, sentence_map = load_word_mapping(text_file)
-        entities = extract_entities(ner_file, word_map)
-        sentences = reconstruct_sentences(sentence_map)
-        # Pass the original sentence_map, not the formatted sentences
-        match_entities_to_sentences(entities, sentence_map)
-        
+        try:
+            sentences, entities = process_pair(text_file, ner_file)
+        except Exception as e:
+            errors.append((text_file, str(e)))
+            continue
         yearly_sentences.extend(sentences)
         yearly_entities.extend(entities)
     
-    return yearly_sentences, yearly_entities
+    return yearly_sentences, yearly_entities, errors
+
+def render_year(year, year_files):
+    """Process one year in a worker and return its formatted output text"""
+    sentences, entities, errors = process_year(year_files)
+    output = io.StringIO()
+    format_year_output(year, sentences, entities, output)
+    return output.getvalue(), errors
 
 def format_year_output(year, sentences, entities, output_handle):
     """Format the output for a single year"""
@@ -138,32 +218,51 @@ def format_year_output(year, sentences, entities, output_handle):
     for text, type_ in sorted(unique_entities):
         output_handle.write(f"- {text} ({type_.upper()})\n")
 
-def batch_process():
-    """Process all files grouped by year"""
+def batch_process(workers=None, input_dir=INPUT_DIR, output_file=None):
+    """Process all files grouped by year, one year per worker process
+
+    output_file defaults to yearly_sentences_annotated.txt in input_dir.
+    """
+    output_file = output_file or os.path.join(input_dir, os.path.basename(OUTPUT_FILE))
     # Group files by year
     year_files = defaultdict(list)
-    for filename in os.listdir(INPUT_DIR):
+    for filename in sorted(os.listdir(input_dir)):
         if filename.endswith('_en.xml'):
             year_match = re.search(r'_(\d{4})_', filename)
             if year_match:
                 year = year_match.group(1)
                 ner_file = filename.replace('_en.xml', '_en-ner.xml')
-                ner_path = os.path.join(INPUT_DIR, ner_file)
+                ner_path = os.path.join(input_dir, ner_file)
                 
                 if os.path.exists(ner_path):
                     year_files[year].append((
-                        os.path.join(INPUT_DIR, filename),
+                        os.path.join(input_dir, filename),
                         ner_path
                     ))
     
-    # Process each year
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as outfile:
-        for year in sorted(year_files.keys()):
+    # Years run in parallel; results are written in year order
+    years = sorted(year_files.keys())
+    failed = 0
+    with open(output_file, 'w', encoding='utf-8') as outfile, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(render_year, years, [year_files[year] for year in years])
+        for year, (output, errors) in zip(years, results):
             print(f"Processing year {year}...")
-            sentences, entities = process_year(year_files[year], outfile)
-            format_year_output(year, sentences, entities, outfile)
+            for text_file, message in errors:
+                print(f"Error processing {os.path.basename(text_file)}: {message}")
+            failed += len(errors)
+            outfile.write(output)
     
-    print(f"\nProcessing complete. Output saved to:\n{OUTPUT_FILE}")
+    if failed:
+        print(f"\n{failed} file pair(s) failed and were skipped")
+    print(f"\nProcessing complete. Output saved to:\n{output_file}")
 
 if __name__ == "__main__":
-    batch_process()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Annotate yearly sentences with their entities")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument("--input-dir", default=INPUT_DIR, help="Folder of _en.xml / _en-ner.xml pairs")
+    parser.add_argument("--output", default=None,
+                        help="Output file (default: yearly_sentences_annotated.txt in the input folder)")
+    args = parser.parse_args()
+    batch_process(args.workers, args.input_dir, args.output)